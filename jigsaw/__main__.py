@@ -0,0 +1,63 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import List, Optional
+
+from .plugin_loader import PluginLoader
+from .profiler import StartupProfiler
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Profiles the startup of the plugins in the given plugin paths
+
+    :param argv: Command line arguments, defaults to sys.argv
+    :return: The exit code
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m jigsaw",
+        description="Profile plugin discovery, resolution, loading and enabling.",
+    )
+    parser.add_argument(
+        "plugin_paths",
+        nargs="*",
+        help="Paths to load plugins from (defaults to ./plugins)",
+    )
+    parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=10,
+        help="Number of entries to show in each ranking",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write a Chrome trace JSON file for chrome://tracing or Perfetto",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Show loader debug logging"
+    )
+    args = parser.parse_args(argv)
+
+    loader = PluginLoader(
+        tuple(os.path.abspath(path) for path in args.plugin_paths),
+        log_level=logging.DEBUG if args.verbose else logging.WARNING,
+    )
+    for path in loader.plugin_paths:
+        if not os.path.isdir(path):
+            parser.error("plugin path {} is not a directory".format(path))
+    profile = StartupProfiler(loader).run()
+    print(profile.format_report(args.top))
+
+    if args.trace:
+        with open(args.trace, "w") as f:
+            json.dump(profile.chrome_trace(), f)
+        print("\nChrome trace written to {}.".format(args.trace))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
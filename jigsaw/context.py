@@ -0,0 +1,179 @@
+import os
+import threading
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Dict, Iterator, Optional, Tuple
+
+from .rescan import Fingerprint, fingerprint, plugin_sources
+from .types import Manifest
+
+ModuleKey = Tuple[str, str, Tuple[Tuple[str, Fingerprint], ...]]
+
+
+class _SharedModule:
+    __slots__ = ("module", "references")
+
+    def __init__(self, module: ModuleType):
+        self.module = module
+        self.references = 0
+
+
+class _ModuleLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class LoaderContext:
+    """
+    A cache of parsed manifests and plugin modules shared by several plugin loaders
+
+    Each loader using the context still creates, enables and disables its own plugin
+    instances. Modules are reference counted per loaded plugin instance, and dropped
+    from the cache once the last loader using them unloads its plugin. Changes to a
+    plugin's source files are noticed once its manifest is rewritten, after which the
+    module is executed again.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._manifests: Dict[str, Tuple[Fingerprint, Manifest]] = {}
+        self._modules: Dict[ModuleKey, _SharedModule] = {}
+        self._module_keys: Dict[str, Tuple[Manifest, ModuleKey]] = {}
+        self._module_locks: Dict[ModuleKey, _ModuleLock] = {}
+
+    def get_manifest(
+        self, path: str, manifest_fingerprint: Fingerprint
+    ) -> Optional[Manifest]:
+        """
+        Gets a previously parsed manifest, if the file has not changed since
+
+        :param path: The plugin folder the manifest was loaded from
+        :param manifest_fingerprint: The current fingerprint of the manifest file
+        :return: The cached manifest, or None if it is missing or outdated
+        """
+        with self._lock:
+            cached = self._manifests.get(path)
+        if cached is None or cached[0] != manifest_fingerprint:
+            return None
+        return cached[1]
+
+    def store_manifest(
+        self, path: str, manifest_fingerprint: Fingerprint, manifest: Manifest
+    ) -> None:
+        """
+        Caches a parsed manifest for other loaders
+
+        :param path: The plugin folder the manifest was loaded from
+        :param manifest_fingerprint: The fingerprint of the parsed manifest file
+        :param manifest: The parsed manifest
+        """
+        with self._lock:
+            self._manifests[path] = (manifest_fingerprint, manifest)
+
+    def module_key(self, manifest: Manifest) -> ModuleKey:
+        """
+        Gets the key a plugin module is cached under
+
+        The plugin's sources are only listed and fingerprinted the first time a key is
+        requested for a parsed manifest. As manifests are shared per manifest file
+        fingerprint, source changes are picked up once the manifest is rewritten.
+
+        :param manifest: The manifest of the plugin
+        :return: The key, which changes whenever one of the plugin's sources changes
+        :raises OSError: If the main file cannot be read
+        """
+        path = manifest.jigsaw.path
+        with self._lock:
+            cached = self._module_keys.get(path)
+        if cached is not None and cached[0] is manifest:
+            return cached[1]
+
+        sources = plugin_sources(manifest)
+        key = (
+            manifest.jigsaw.id,
+            os.path.abspath(sources[0]),
+            tuple((i, fingerprint(os.stat(i))) for i in sources),
+        )
+        with self._lock:
+            self._module_keys[path] = (manifest, key)
+        return key
+
+    @contextmanager
+    def lock_module(self, key: ModuleKey) -> Iterator[None]:
+        """
+        Keeps other loaders from importing a plugin module at the same time
+
+        Held from looking up the shared module until it is retained, so that only the
+        first of several loaders missing the cache executes the module.
+
+        :param key: The key of the module
+        """
+        with self._lock:
+            entry = self._module_locks.get(key)
+            if entry is None:
+                entry = self._module_locks[key] = _ModuleLock()
+            entry.users += 1
+        try:
+            with entry.lock:
+                yield
+        finally:
+            with self._lock:
+                entry.users -= 1
+                if entry.users == 0:
+                    del self._module_locks[key]
+
+    def get_module(self, key: ModuleKey) -> Optional[ModuleType]:
+        """
+        Gets a shared plugin module
+
+        :param key: The key of the module
+        :return: The module, or None if no loader currently uses it
+        """
+        with self._lock:
+            entry = self._modules.get(key)
+        return None if entry is None else entry.module
+
+    def retain(self, key: ModuleKey, module: ModuleType) -> None:
+        """
+        Adds a reference to a plugin module and shares it with later loaders
+
+        If a different module is already shared under the key, such as after a reload,
+        the given module replaces it.
+
+        :param key: The key of the module
+        :param module: The module
+        """
+        with self._lock:
+            entry = self._modules.get(key)
+            if entry is None:
+                entry = self._modules[key] = _SharedModule(module)
+            entry.module = module
+            entry.references += 1
+
+    def release(self, key: ModuleKey) -> None:
+        """
+        Removes a reference to a shared plugin module, dropping it once unused
+
+        :param key: The key of the module
+        """
+        with self._lock:
+            entry = self._modules.get(key)
+            if entry is None:
+                return
+            entry.references -= 1
+            if entry.references == 0:
+                del self._modules[key]
+
+    def references(self, key: ModuleKey) -> int:
+        """
+        Gets how many loaded plugin instances use a shared module
+
+        :param key: The key of the module
+        :return: The number of references
+        """
+        with self._lock:
+            entry = self._modules.get(key)
+            return 0 if entry is None else entry.references
@@ -0,0 +1,134 @@
+from typing import Dict, List, Mapping, NamedTuple, Sequence, Tuple
+
+
+class CriticalPathAnalysis(NamedTuple):
+    """
+    The critical path of the plugin dependency graph, weighted by measured startup costs
+    """
+
+    path: List[str]
+    costs: Dict[str, float]
+    earliest_start: Dict[str, float]
+    slack: Dict[str, float]
+    serial_time: float
+    parallel_time: float
+    edge_savings: List[Tuple[str, str, float]]
+
+    def format_report(self) -> str:
+        """
+        Formats the analysis as a human readable report
+
+        :return: The report
+        """
+        lines = [
+            "Serial startup time:      {:>10.2f} ms".format(self.serial_time * 1000),
+            "Best parallel startup:    {:>10.2f} ms".format(self.parallel_time * 1000),
+            "",
+            "Critical path:",
+        ]
+        for plugin_id in self.path:
+            lines.append(
+                "  {:<30} {:>7.2f} ms (starts at {:.2f} ms)".format(
+                    plugin_id,
+                    self.costs[plugin_id] * 1000,
+                    self.earliest_start[plugin_id] * 1000,
+                )
+            )
+
+        if self.edge_savings:
+            lines.append("")
+            lines.append("Dependency edges worth removing:")
+            for dependency, dependent, saving in self.edge_savings:
+                edge = "{} -> {}".format(dependent, dependency)
+                lines.append("  {:<60} saves {:.2f} ms".format(edge, saving * 1000))
+
+        lines.append("")
+        lines.append("Slack:")
+        for plugin_id, slack in sorted(self.slack.items(), key=lambda i: i[1]):
+            lines.append("  {:<30} {:>7.2f} ms".format(plugin_id, slack * 1000))
+        return "\n".join(lines)
+
+
+def _topological_order(
+    costs: Mapping[str, float], dependencies: Mapping[str, Sequence[str]]
+) -> List[str]:
+    remaining = {plugin_id: len(dependencies.get(plugin_id, ())) for plugin_id in costs}
+    dependents: Dict[str, List[str]] = {plugin_id: [] for plugin_id in costs}
+    for plugin_id in costs:
+        for dependency in dependencies.get(plugin_id, ()):
+            dependents[dependency].append(plugin_id)
+
+    order = [plugin_id for plugin_id, count in remaining.items() if count == 0]
+    for plugin_id in order:
+        for dependent in dependents[plugin_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                order.append(dependent)
+    if len(order) != len(costs):
+        raise ValueError("The plugin dependency graph contains a cycle.")
+    return order
+
+
+def _earliest_finish(
+    order: Sequence[str],
+    costs: Mapping[str, float],
+    dependencies: Mapping[str, Sequence[str]],
+) -> Dict[str, float]:
+    finish: Dict[str, float] = {}
+    for plugin_id in order:
+        finish[plugin_id] = costs[plugin_id] + max(
+            (finish[i] for i in dependencies.get(plugin_id, ())), default=0.0
+        )
+    return finish
+
+
+def analyze(
+    costs: Mapping[str, float], dependencies: Mapping[str, Sequence[str]]
+) -> CriticalPathAnalysis:
+    """
+    Computes the critical path, slack and best parallel startup time of a plugin graph
+
+    :param costs: The startup cost of each plugin, keyed by ID
+    :param dependencies: The IDs each plugin depends on, limited to IDs in costs
+    :return: The analysis
+    :raises ValueError: If the dependency graph contains a cycle
+    """
+    order = _topological_order(costs, dependencies)
+    finish = _earliest_finish(order, costs, dependencies)
+    parallel_time = max(finish.values(), default=0.0)
+
+    latest_finish = {plugin_id: parallel_time for plugin_id in costs}
+    for plugin_id in reversed(order):
+        latest_start = latest_finish[plugin_id] - costs[plugin_id]
+        for dependency in dependencies.get(plugin_id, ()):
+            latest_finish[dependency] = min(latest_finish[dependency], latest_start)
+
+    path: List[str] = []
+    if order:
+        current = max(order, key=finish.__getitem__)
+        while True:
+            path.append(current)
+            deps = dependencies.get(current, ())
+            if not deps:
+                break
+            current = max(deps, key=finish.__getitem__)
+        path.reverse()
+
+    edge_savings = []
+    for dependency, dependent in zip(path, path[1:]):
+        pruned = dict(dependencies)
+        pruned[dependent] = [i for i in dependencies[dependent] if i != dependency]
+        without = max(_earliest_finish(order, costs, pruned).values())
+        if without < parallel_time:
+            edge_savings.append((dependency, dependent, parallel_time - without))
+    edge_savings.sort(key=lambda i: i[2], reverse=True)
+
+    return CriticalPathAnalysis(
+        path=path,
+        costs=dict(costs),
+        earliest_start={i: finish[i] - costs[i] for i in order},
+        slack={i: latest_finish[i] - finish[i] for i in order},
+        serial_time=sum(costs.values()),
+        parallel_time=parallel_time,
+        edge_savings=edge_savings,
+    )
@@ -0,0 +1,55 @@
+from typing import Mapping
+
+from .types import Manifest
+
+
+class LoaderListener:
+    """
+    Receives notifications as a plugin loader resolves, loads and enables plugins
+
+    Subclasses override the notifications they are interested in; by default each
+    does nothing.
+    """
+
+    def manifests_resolved(self, resolved: Mapping[str, Manifest]) -> None:
+        """
+        Called after the loader selected the manifest to use for each plugin
+
+        :param resolved: The selected manifests, keyed by ID
+        """
+        pass
+
+    def load_started(self, manifest: Manifest) -> None:
+        """
+        Called before a plugin that is not loaded yet starts loading
+
+        Dependencies are loaded afterwards, so notifications for them are nested
+        inside the notifications for the plugin depending on them.
+
+        :param manifest: The manifest of the plugin
+        """
+        pass
+
+    def load_finished(self, manifest: Manifest) -> None:
+        """
+        Called after a plugin finished loading, whether or not it loaded successfully
+
+        :param manifest: The manifest of the plugin
+        """
+        pass
+
+    def enable_started(self, plugin_id: str) -> None:
+        """
+        Called before a plugin is enabled
+
+        :param plugin_id: The ID of the plugin
+        """
+        pass
+
+    def enable_finished(self, plugin_id: str) -> None:
+        """
+        Called after a plugin was enabled, or its enable method raised an exception
+
+        :param plugin_id: The ID of the plugin
+        """
+        pass
@@ -1,15 +1,53 @@
 import importlib.util
 import logging
 import os
+import time
 import traceback
+from contextlib import contextmanager, nullcontext
 from importlib.abc import Loader
 from types import ModuleType
-from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 import tomli
 
+from .context import LoaderContext, ModuleKey
+from .critical_path import CriticalPathAnalysis, analyze
+from .listeners import LoaderListener
 from .plugin import JigsawPlugin
+from .prefetch import SourcePrefetcher, load_order
+from .rescan import Fingerprint, ManifestChanges, fingerprint, scan_plugin_dirs
+from .resolver import Resolver, candidate_key
+from .sandbox import ImportGuard
+from .transaction import PluginTransaction, TransactionError
 from .types import Manifest
+from .versions import Requirement
+from .views import PluginRecord, PluginView
+
+
+class _LoaderState(NamedTuple):
+    manifests: List[Manifest]
+    resolved: Dict[str, Manifest]
+    fingerprints: Dict[str, Fingerprint]
+    plugins: Dict[str, Any]
+    modules: Dict[str, ModuleType]
+    load_costs: Dict[str, float]
+    enable_costs: Dict[str, float]
+    records: Dict[str, PluginRecord]
+    enabled: Set[str]
+    module_keys: Dict[str, ModuleKey]
 
 
 class PluginLoader:
@@ -22,6 +60,8 @@ class PluginLoader:
         plugin_paths: Tuple[str, ...] = (),
         log_level: int = logging.INFO,
         plugin_class: Type[JigsawPlugin] = JigsawPlugin,
+        prefetch_window: int = 0,
+        context: Optional[LoaderContext] = None,
     ):
         """
         Initializes the plugin loader
@@ -29,6 +69,8 @@ class PluginLoader:
         :param plugin_paths: Paths to load plugins from
         :param log_level: Log level
         :param plugin_class: Parent class of all plugins
+        :param prefetch_window: Number of plugins to prefetch ahead, 0 to disable
+        :param context: Context to share manifests and plugin modules through
         """
         logging.basicConfig(
             format="{%(asctime)s} (%(name)s) [%(levelname)s]: %(message)s",
@@ -53,8 +95,28 @@ class PluginLoader:
         self._plugin_class = plugin_class
 
         self._manifests: List[Manifest] = []
+        self._resolved: Dict[str, Manifest] = {}
+        self._fingerprints: Dict[str, Fingerprint] = {}
         self._plugins: Dict[str, Any] = {}
         self._modules: Dict[str, ModuleType] = {}
+        self._records: Dict[str, PluginRecord] = {}
+        self._enabled: Set[str] = set()
+        self._generation = 0
+
+        self._load_costs: Dict[str, float] = {}
+        self._enable_costs: Dict[str, float] = {}
+        self._nested_load_time: List[float] = []
+        self._import_guard = ImportGuard()
+
+        self._prefetch_window = prefetch_window
+        self._prefetcher: Optional[SourcePrefetcher] = None
+
+        self._context = context
+        self._module_keys: Dict[str, ModuleKey] = {}
+        # Plugins being reloaded, which import their module again instead of sharing it
+        self._reimport: Set[str] = set()
+
+        self._listeners: List[LoaderListener] = []
 
     def load_manifests(self) -> None:
         """
@@ -66,23 +128,39 @@ class PluginLoader:
                 if os.path.isdir(item_path):
                     self.load_manifest(item_path)
 
-    def load_manifest(self, path: str) -> None:
-        """
-        Loads a plugin manifest from a given path
-
-        :param path: The folder to load the plugin manifest from
-        """
+    def _read_manifest(self, path: str) -> Optional[Tuple[Manifest, Fingerprint]]:
         manifest_path = os.path.join(path, "plugin.toml")
         self._logger.debug(
             "Attempting to load plugin manifest from {}.".format(manifest_path)
         )
         try:
             with open(manifest_path, "rb") as f:
+                # Fingerprint the file that is actually read, so a concurrent edit is
+                # picked up by the next rescan rather than missed
+                file_fingerprint = fingerprint(os.fstat(f.fileno()))
+                if self._context is not None:
+                    cached = self._context.get_manifest(path, file_fingerprint)
+                    if cached is not None:
+                        self._logger.debug(
+                            "Using shared plugin manifest for {}.".format(path)
+                        )
+                        return cached, file_fingerprint
                 manifest = tomli.load(f)
 
             manifest.get("jigsaw", {})["path"] = path
-            self._manifests.append(Manifest.parse_obj(manifest))
+            parsed = Manifest.parse_obj(manifest)
+            if (
+                parsed.jigsaw.version is not None
+                and parsed.jigsaw.parsed_version is None
+            ):
+                self._logger.warning(
+                    "Plugin {} has an unrecognized version {!r}, treating it as "
+                    "unversioned.".format(parsed.jigsaw.id, parsed.jigsaw.version)
+                )
+            if self._context is not None:
+                self._context.store_manifest(path, file_fingerprint, parsed)
             self._logger.debug("Loaded plugin manifest from {}.".format(manifest_path))
+            return parsed, file_fingerprint
         except ValueError:
             self._logger.exception(
                 "Failed to decode plugin manifest at {}.".format(manifest_path)
@@ -91,6 +169,19 @@ class PluginLoader:
             self._logger.exception(
                 "Failed to load plugin manifest at {}.".format(manifest_path)
             )
+        return None
+
+    def load_manifest(self, path: str) -> None:
+        """
+        Loads a plugin manifest from a given path
+
+        :param path: The folder to load the plugin manifest from
+        """
+        result = self._read_manifest(path)
+        if result is not None:
+            self._manifests.append(result[0])
+            self._fingerprints[path] = result[1]
+            self._resolved = {}
 
     def get_manifest(self, plugin_id: str) -> Optional[Manifest]:
         """
@@ -99,11 +190,52 @@ class PluginLoader:
         :param plugin_id: The ID of the plugin
         :return: The manifest for the specified plugin
         """
+        if plugin_id in self._resolved:
+            return self._resolved[plugin_id]
         for manifest in self._manifests:
             if manifest.jigsaw.id == plugin_id:
                 return manifest
         return None
 
+    def find_manifest(self, requirement: Requirement) -> Optional[Manifest]:
+        """
+        Finds the preferred manifest satisfying a dependency requirement
+
+        :param requirement: The requirement to satisfy
+        :return: The resolved manifest if it matches, otherwise the newest match
+        """
+        resolved = self._resolved.get(requirement.id)
+        if resolved is not None and requirement.matches(resolved.jigsaw.parsed_version):
+            return resolved
+        matching = [
+            manifest
+            for manifest in self._manifests
+            if manifest.jigsaw.id == requirement.id
+            and requirement.matches(manifest.jigsaw.parsed_version)
+        ]
+        if len(matching) == 0:
+            return None
+        return max(matching, key=candidate_key)
+
+    def resolve_manifests(self) -> Dict[str, Manifest]:
+        """
+        Selects one manifest per plugin that satisfies all dependency specifiers
+
+        Plugins whose dependencies cannot be satisfied are left out of the result.
+
+        :return: The selected manifest for each plugin, keyed by ID
+        """
+        self._logger.debug("Resolving plugin manifests.")
+        resolved, failures = Resolver(self._manifests).resolve_all()
+        for plugin_id, reason in failures.items():
+            self._logger.error(
+                "Plugin {} could not be resolved: {}.".format(plugin_id, reason)
+            )
+        self._resolved = resolved
+        for listener in self._listeners:
+            listener.manifests_resolved(resolved)
+        return dict(resolved)
+
     def get_plugin_loaded(self, plugin_id: str) -> bool:
         """
         Returns if a given plugin is loaded
@@ -125,27 +257,45 @@ class PluginLoader:
                 "Plugin {} is already loaded.".format(manifest.jigsaw.id)
             )
             return
+
+        for listener in self._listeners:
+            listener.load_started(manifest)
+        # Dependency load time is accumulated separately so it can be excluded
+        start = time.perf_counter()
+        self._nested_load_time.append(0.0)
+        try:
+            self._load_plugin(manifest, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested_load_time.pop()
+            if self._nested_load_time:
+                self._nested_load_time[-1] += elapsed
+            if self.get_plugin_loaded(manifest.jigsaw.id):
+                self._load_costs[manifest.jigsaw.id] = elapsed - nested
+            for listener in self._listeners:
+                listener.load_finished(manifest)
+
+    def _load_plugin(self, manifest: Manifest, *args: Any) -> None:
         try:
             self._logger.debug(
                 "Attempting to load plugin {}.".format(manifest.jigsaw.id)
             )
-            for dependency in manifest.jigsaw.dependencies:
-                if not self.get_plugin_loaded(dependency):
+            requirements = manifest.jigsaw.requirements
+            for dependency in requirements:
+                if not self.get_plugin_loaded(dependency.id):
                     self._logger.debug(
                         "Must load dependency {} first.".format(dependency)
                     )
-                    if self.get_manifest(dependency) is None:
+                    dep_manifest = self.find_manifest(dependency)
+                    if dep_manifest is None:
                         self._logger.error(
                             "Dependency {} could not be found.".format(dependency)
                         )
                     else:
-                        dep_manifest = self.get_manifest(dependency)
-                        assert dep_manifest is not None
-
                         self.load_plugin(dep_manifest, *args)
 
             not_loaded = [
-                i for i in manifest.jigsaw.dependencies if not self.get_plugin_loaded(i)
+                str(i) for i in requirements if not self._dependency_satisfied(i)
             ]
             if len(not_loaded) != 0:
                 self._logger.error(
@@ -155,29 +305,50 @@ class PluginLoader:
                 )
                 return
 
-            spec = importlib.util.spec_from_file_location(
-                manifest.jigsaw.name.replace(" ", "_"),
-                os.path.join(manifest.jigsaw.path, manifest.jigsaw.main_file),
-            )
-            assert spec is not None
+            # Only now is this plugin's own source read, after its dependencies'
+            if self._prefetcher is not None:
+                self._prefetcher.advance(manifest.jigsaw.id)
+
+            context = self._context
+            module_key = None if context is None else context.module_key(manifest)
+            reimport = manifest.jigsaw.id in self._reimport
+            self._reimport.discard(manifest.jigsaw.id)
+
+            # Other loaders sharing the context wait instead of importing it as well
+            module_lock: ContextManager[None] = nullcontext()
+            if context is not None and module_key is not None:
+                module_lock = context.lock_module(module_key)
+            with module_lock:
+                module = None
+                if context is not None and module_key is not None and not reimport:
+                    module = context.get_module(module_key)
+                    if module is not None:
+                        self._logger.debug(
+                            "Using shared module for {}.".format(manifest.jigsaw.id)
+                        )
 
-            module = importlib.util.module_from_spec(spec)
-            assert isinstance(spec.loader, Loader)
-            spec.loader.exec_module(module)
+                with self._import_guard.enforce(manifest):
+                    if module is None:
+                        module = self._import_module(manifest)
 
-            module_class = manifest.jigsaw.main_class
-            plugin_class = getattr(module, module_class)
-            if issubclass(plugin_class, self._plugin_class):
-                plugin = plugin_class(manifest, *args)
-            else:
-                self._logger.error(
-                    "Failed to load {} due to invalid baseclass.".format(
-                        manifest.jigsaw.id
-                    )
-                )
-                return
+                    module_class = manifest.jigsaw.main_class
+                    plugin_class = getattr(module, module_class)
+                    if issubclass(plugin_class, self._plugin_class):
+                        plugin = plugin_class(manifest, *args)
+                    else:
+                        self._logger.error(
+                            "Failed to load {} due to invalid baseclass.".format(
+                                manifest.jigsaw.id
+                            )
+                        )
+                        return
+                if context is not None and module_key is not None:
+                    context.retain(module_key, module)
+                    self._module_keys[manifest.jigsaw.id] = module_key
             self._plugins[manifest.jigsaw.id] = plugin
             self._modules[manifest.jigsaw.id] = module
+            self._records[manifest.jigsaw.id] = PluginRecord(manifest, plugin, module)
+            self._generation += 1
 
             self._logger.debug("Plugin {} loaded.".format(manifest.jigsaw.name))
 
@@ -191,14 +362,60 @@ class PluginLoader:
                 )
             )
 
+    def _import_module(self, manifest: Manifest) -> ModuleType:
+        spec = importlib.util.spec_from_file_location(
+            manifest.jigsaw.name.replace(" ", "_"),
+            os.path.join(manifest.jigsaw.path, manifest.jigsaw.main_file),
+        )
+        assert spec is not None
+
+        module = importlib.util.module_from_spec(spec)
+        assert isinstance(spec.loader, Loader)
+        spec.loader.exec_module(module)
+        return module
+
+    def _dependency_satisfied(self, requirement: Requirement) -> bool:
+        plugin = self.get_plugin(requirement.id)
+        return plugin is not None and requirement.matches(
+            plugin.manifest.jigsaw.parsed_version
+        )
+
     def load_plugins(self, *args: Any) -> None:
         """
-        Loads all plugins
+        Loads all plugins, using the resolved manifest for each plugin
 
         :param args: Arguments to pass to the plugins
         """
-        for manifest in self._manifests:
-            self.load_plugin(manifest, *args)
+        resolved = self.resolve_manifests()
+        manifests = [
+            manifest
+            for manifest in self._manifests
+            if resolved.get(manifest.jigsaw.id) is manifest
+        ]
+        with self.prefetching(load_order(manifests, resolved)):
+            for manifest in manifests:
+                self.load_plugin(manifest, *args)
+
+    @contextmanager
+    def prefetching(self, order: Sequence[Manifest]) -> Iterator[None]:
+        """
+        Prefetches plugin sources in the background while plugins load in order
+
+        Does nothing unless the loader was created with a prefetch window.
+
+        :param order: The manifests in the order they will be loaded
+        """
+        if self._prefetch_window <= 0 or self._prefetcher is not None:
+            yield
+            return
+        prefetcher = SourcePrefetcher(order, self._prefetch_window)
+        prefetcher.start()
+        self._prefetcher = prefetcher
+        try:
+            yield
+        finally:
+            self._prefetcher = None
+            prefetcher.stop()
 
     def get_plugin(self, id: str) -> Optional[Any]:
         """
@@ -235,25 +452,152 @@ class PluginLoader:
         return [
             {
                 "manifest": i,
-                "plugin": self.get_plugin(i.jigsaw.id),
-                "module": self.get_module(i.jigsaw.id),
+                "plugin": self._plugins.get(i.jigsaw.id),
+                "module": self._modules.get(i.jigsaw.id),
             }
             for i in self._manifests
         ]
 
+    @property
+    def generation(self) -> int:
+        """
+        A counter that changes when plugins are loaded, unloaded, enabled or disabled
+
+        Callers can cache structures derived from the views below and rebuild them only
+        when the generation differs from the one they were built at.
+        """
+        return self._generation
+
+    def view_plugins(self) -> PluginView:
+        """
+        Gets a live view of all loaded plugins
+
+        :return: A view of PluginRecords, in load order
+        """
+        return PluginView(self)
+
+    def view_enabled_plugins(self) -> PluginView:
+        """
+        Gets a live view of the loaded plugins that are enabled
+
+        :return: A view of PluginRecords, in load order
+        """
+        return PluginView(self, lambda record: record.id in self._enabled)
+
+    def view_dependents(self, id: str) -> PluginView:
+        """
+        Gets a live view of the loaded plugins that directly depend on a plugin
+
+        :param id: ID of the plugin depended on
+        :return: A view of PluginRecords, in load order
+        """
+        return PluginView(self, lambda record: id in record.dependencies)
+
+    def get_plugin_enabled(self, plugin_id: str) -> bool:
+        """
+        Returns if a given plugin is enabled
+
+        :param plugin_id: The plugin to check the enabled status for
+        :return: Whether the specified plugin is enabled
+        """
+        return plugin_id in self._enabled
+
+    def disable_plugin(self, id: str) -> None:
+        """
+        Calls the disable method on a loaded plugin
+
+        :param id: The ID of the plugin
+        """
+        self._plugins[id].disable()
+        self._enabled.discard(id)
+        self._generation += 1
+
     def disable_all_plugins(self) -> None:
         """
         Calls the disable method on all initialized plugins
         """
         for plugin in self._plugins:
-            self._plugins[plugin].disable()
+            self.disable_plugin(plugin)
+
+    def enable_plugin(self, id: str) -> None:
+        """
+        Calls the enable method on a loaded plugin, recording how long it took
+
+        :param id: The ID of the plugin
+        """
+        for listener in self._listeners:
+            listener.enable_started(id)
+        try:
+            start = time.perf_counter()
+            self._plugins[id].enable()
+            self._enable_costs[id] = time.perf_counter() - start
+            self._enabled.add(id)
+            self._generation += 1
+        finally:
+            for listener in self._listeners:
+                listener.enable_finished(id)
 
     def enable_all_plugins(self) -> None:
         """
         Calls the enable method on all initialized plugins
         """
         for plugin in self._plugins:
-            self._plugins[plugin].enable()
+            self.enable_plugin(plugin)
+
+    def add_listener(self, listener: LoaderListener) -> None:
+        """
+        Registers a listener to be notified as plugins are resolved, loaded and enabled
+
+        :param listener: The listener to add
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: LoaderListener) -> None:
+        """
+        Unregisters a listener
+
+        :param listener: The listener to remove
+        """
+        self._listeners.remove(listener)
+
+    def get_load_cost(self, id: str) -> Optional[float]:
+        """
+        Gets how long a plugin took to load, excluding its dependencies
+
+        :param id: ID of the plugin
+        :return: The load time in seconds, or None if the plugin is not loaded
+        """
+        return self._load_costs.get(id)
+
+    def get_enable_cost(self, id: str) -> Optional[float]:
+        """
+        Gets how long a plugin took to enable
+
+        :param id: ID of the plugin
+        :return: The enable time in seconds, or None if the plugin has not been enabled
+        """
+        return self._enable_costs.get(id)
+
+    def analyze_critical_path(self) -> CriticalPathAnalysis:
+        """
+        Finds the longest dependency chain of loaded plugins, weighted by startup cost
+
+        :return: The critical path, per plugin slack and best parallel startup time
+        """
+        costs = {
+            plugin_id: self._load_costs.get(plugin_id, 0.0)
+            + self._enable_costs.get(plugin_id, 0.0)
+            for plugin_id in self._plugins
+        }
+        dependencies = {
+            plugin_id: [
+                i.id
+                for i in plugin.manifest.jigsaw.requirements
+                if i.id in self._plugins
+            ]
+            for plugin_id, plugin in self._plugins.items()
+        }
+        return analyze(costs, dependencies)
 
     def reload_manifest(self, manifest: Manifest) -> None:
         """
@@ -262,17 +606,150 @@ class PluginLoader:
         """
         self._logger.debug("Reloading manifest for {}.".format(manifest.jigsaw.id))
         self._manifests.remove(manifest)
+        self._resolved = {}
         self.load_manifest(manifest.jigsaw.path)
         self._logger.debug("Manifest reloaded.")
 
-    def reload_all_manifests(self) -> None:
+    def rescan_manifests(self) -> ManifestChanges:
+        """
+        Diffs the plugin paths against loaded manifests, parsing only changed ones
+
+        Unchanged manifest objects are kept, so loaded plugins keep pointing at
+        manifests in the list. A modified manifest that fails to parse keeps its
+        previous version until it is fixed.
+
+        :return: The manifests that were added, removed, changed or left unchanged
+        """
+        on_disk = scan_plugin_dirs(self.plugin_paths)
+        known = {manifest.jigsaw.path: manifest for manifest in self._manifests}
+        changes = ManifestChanges([], [], [], [])
+
+        for path, current in on_disk.items():
+            old = known.get(path)
+            if current is None:
+                if old is not None:
+                    changes.removed.append(old)
+                continue
+            if old is not None and self._fingerprints.get(path) == current:
+                changes.unchanged.append(old)
+                continue
+            result = self._read_manifest(path)
+            if result is None:
+                if old is not None:
+                    changes.unchanged.append(old)
+                continue
+            new, self._fingerprints[path] = result
+            if old is None:
+                changes.added.append(new)
+            else:
+                changes.changed.append((old, new))
+
+        for path, old in known.items():
+            if path not in on_disk:
+                changes.removed.append(old)
+
+        if changes:
+            replacements = {id(old): new for old, new in changes.changed}
+            removed = {id(i) for i in changes.removed}
+            self._manifests = [
+                replacements.get(id(i), i)
+                for i in self._manifests
+                if id(i) not in removed
+            ] + changes.added
+            for manifest in changes.removed:
+                self._fingerprints.pop(manifest.jigsaw.path, None)
+            self._resolved = {}
+        return changes
+
+    def reload_all_manifests(self) -> ManifestChanges:
         """
-        Reloads all loaded manifests, and loads any new manifests
+        Reloads all modified manifests, and loads any new manifests
+
+        :return: The changes found, which can be passed to apply_manifest_changes
         """
         self._logger.debug("Reloading all manifests.")
-        self._manifests = []
-        self.load_manifests()
-        self._logger.debug("All manifests reloaded.")
+        changes = self.rescan_manifests()
+        self._logger.debug(
+            "All manifests reloaded. {} added, {} removed, {} changed.".format(
+                len(changes.added), len(changes.removed), len(changes.changed)
+            )
+        )
+        return changes
+
+    def apply_manifest_changes(self, changes: ManifestChanges, *args: Any) -> None:
+        """
+        Brings loaded plugins in line with a set of manifest changes
+
+        Plugins whose manifest was removed are unloaded and loaded plugins whose
+        manifest changed are reloaded, together in a single transaction. New plugins are
+        loaded and enabled even if that transaction fails, and one that fails to load
+        does not keep the others from loading.
+
+        :param changes: The changes returned by rescan_manifests or reload_all_manifests
+        :param args: Arguments to pass to the plugins
+        :raises TransactionError: If unloading or reloading would leave a dependency
+            unsatisfied or failed, in which case those plugins are left unchanged
+        """
+        transaction = self.transaction(*args)
+        staged = False
+        for manifest in changes.removed:
+            if self._loaded_from(manifest):
+                transaction.unload(manifest.jigsaw.id)
+                staged = True
+        for old, new in changes.changed:
+            if not self._loaded_from(old):
+                continue
+            if old.jigsaw.id == new.jigsaw.id:
+                transaction.reload(old.jigsaw.id)
+            else:
+                transaction.unload(old.jigsaw.id)
+                if not self.get_plugin_loaded(new.jigsaw.id):
+                    transaction.load(new)
+            staged = True
+        for manifest in changes.added:
+            # Its manifest came back after a removal was rejected
+            if self._loaded_from(manifest):
+                transaction.reload(manifest.jigsaw.id)
+                staged = True
+
+        error: Optional[TransactionError] = None
+        if staged:
+            try:
+                transaction.commit()
+            except TransactionError as e:
+                error = e
+        self._load_added(changes.added, *args)
+        if error is not None:
+            raise error
+
+    def _load_added(self, manifests: List[Manifest], *args: Any) -> None:
+        added: Dict[str, Manifest] = {}
+        for manifest in manifests:
+            if not self.get_plugin_loaded(manifest.jigsaw.id):
+                added.setdefault(manifest.jigsaw.id, manifest)
+        if not added:
+            return
+        try:
+            with self.transaction(*args) as transaction:
+                for manifest in added.values():
+                    transaction.load(manifest)
+        except TransactionError:
+            for plugin_id, manifest in added.items():
+                try:
+                    with self.transaction(*args) as transaction:
+                        transaction.load(manifest)
+                except TransactionError as e:
+                    self._logger.error(
+                        "Could not load plugin {}: {}".format(plugin_id, e)
+                    )
+
+    def _loaded_from(self, manifest: Manifest) -> bool:
+        # Other manifests may share the ID of the loaded plugin, such as older versions,
+        # and a rescan may already have replaced the manifest of a failed reload
+        plugin = self.get_plugin(manifest.jigsaw.id)
+        return (
+            plugin is not None and plugin.manifest.jigsaw.path == manifest.jigsaw.path
+        )
 
     def reload_plugin(self, id: str, *args: Any) -> None:
         """
@@ -284,59 +761,119 @@ class PluginLoader:
         self._logger.debug("Reloading {}.".format(id))
 
         self._logger.debug("Disabling {}.".format(id))
-        plugin = self.get_plugin(id)
-        assert plugin is not None
-        plugin.disable()
+        assert self.get_plugin(id) is not None
+        # Other manifests may share the ID, so use the one the plugin was loaded from
+        old_manifest = self._plugins[id].manifest
+        self.disable_plugin(id)
 
-        self._logger.debug("Removing plugin instance.")
-        del self._plugins[id]
-
-        self._logger.debug("Unloading module.")
-        del self._modules[id]
+        self._remove_plugin(id)
+        self._reimport.add(id)
 
         self._logger.debug("Reloading manifest.")
-        old_manifest = self.get_manifest(id)
-        assert old_manifest is not None
-        self._manifests.remove(old_manifest)
-        self.load_manifest(old_manifest.jigsaw.path)
+        result = self._read_manifest(old_manifest.jigsaw.path)
+        assert result is not None
+        new_manifest, manifest_fingerprint = result
+        self._manifests = [
+            new_manifest if i is old_manifest else i for i in self._manifests
+        ]
+        self._fingerprints[new_manifest.jigsaw.path] = manifest_fingerprint
+        self._resolved = {}
 
         self._logger.debug("Loading {}.".format(id))
-        new_manifest = self.get_manifest(id)
-        assert new_manifest is not None
         self.load_plugin(new_manifest, *args)
 
         self._logger.debug("Enabling {}.".format(id))
-        plugin = self.get_plugin(id)
-        assert plugin is not None
-        plugin.enable()
+        assert self.get_plugin(id) is not None
+        self.enable_plugin(id)
 
         self._logger.debug("Plugin {} reloaded.".format(id))
 
     def reload_all_plugins(self, *args: Any) -> None:
         """
-        Reloads all initialized plugins
+        Reloads all initialized plugins, keeping the current ones if any reload fails
+
+        :raises TransactionError: If a plugin failed to reload
         """
-        for manifest in self._manifests[:]:
-            if self.get_plugin(manifest.jigsaw.name) is not None:
-                self.reload_plugin(manifest.jigsaw.name, *args)
+        with self.transaction(*args) as transaction:
+            for plugin_id in self._plugins:
+                transaction.reload(plugin_id)
 
-    def unload_plugin(self, id: str) -> None:
+    def transaction(self, *args: Any) -> PluginTransaction:
         """
-        Unloads a specified plugin
-        :param id: The ID of the plugin
+        Starts a transaction that stages loads, unloads and reloads to apply atomically
+
+        Used as a context manager, the transaction is committed when the block exits
+        without an exception.
+
+        :param args: Arguments to pass to loaded plugins
+        :return: The transaction
         """
-        self._logger.debug("Unloading {}.".format(id))
+        return PluginTransaction(self, *args)
+
+    def _snapshot(self) -> _LoaderState:
+        return _LoaderState(
+            list(self._manifests),
+            dict(self._resolved),
+            dict(self._fingerprints),
+            dict(self._plugins),
+            dict(self._modules),
+            dict(self._load_costs),
+            dict(self._enable_costs),
+            dict(self._records),
+            set(self._enabled),
+            dict(self._module_keys),
+        )
 
+    def _restore(self, state: _LoaderState) -> None:
+        self._manifests = state.manifests
+        self._resolved = state.resolved
+        self._fingerprints = state.fingerprints
+        self._plugins = state.plugins
+        self._modules = state.modules
+        self._load_costs = state.load_costs
+        self._enable_costs = state.enable_costs
+        self._records = state.records
+        self._enabled = state.enabled
+        if self._context is not None:
+            # Retain first, so modules shared by both states are not dropped in between
+            for plugin_id, key in state.module_keys.items():
+                self._context.retain(key, state.modules[plugin_id])
+            for key in self._module_keys.values():
+                self._context.release(key)
+        self._module_keys = state.module_keys
+        self._reimport.clear()
+        self._generation += 1
+
+    def _remove_plugin(self, id: str) -> None:
         self._logger.debug("Removing plugin instance.")
         del self._plugins[id]
 
         self._logger.debug("Unloading module.")
         del self._modules[id]
+        self._load_costs.pop(id, None)
+        self._enable_costs.pop(id, None)
+        self._import_guard.forget(id)
+        del self._records[id]
+        self._enabled.discard(id)
+        module_key = self._module_keys.pop(id, None)
+        if self._context is not None and module_key is not None:
+            self._context.release(module_key)
+        self._generation += 1
+
+    def unload_plugin(self, id: str) -> None:
+        """
+        Unloads a specified plugin
+        :param id: The ID of the plugin
+        """
+        self._logger.debug("Unloading {}.".format(id))
+
+        manifest = self._plugins[id].manifest
+        self._remove_plugin(id)
 
         self._logger.debug("Unloading manifest...")
-        manifest = self.get_manifest(id)
-        assert manifest is not None
-        self._manifests.remove(manifest)
+        self._manifests = [i for i in self._manifests if i is not manifest]
+        self._fingerprints.pop(manifest.jigsaw.path, None)
+        self._resolved = {}
 
         self._logger.debug("{} unloaded.".format(id))
 
@@ -0,0 +1,161 @@
+import importlib.util
+import logging
+import os
+import threading
+from typing import Dict, List, Mapping, Optional, Sequence, Set
+
+from .rescan import plugin_sources
+from .types import Manifest
+
+_READ_SIZE = 1 << 20
+
+
+def load_order(
+    manifests: Sequence[Manifest], resolved: Mapping[str, Manifest]
+) -> List[Manifest]:
+    """
+    Predicts the order load_plugin will load manifests in, dependencies first
+
+    :param manifests: The manifests that will be loaded, in the order they are loaded
+    :param resolved: The manifest used for each dependency, keyed by ID
+    :return: The manifests, including dependencies, in load order
+    """
+    order: List[Manifest] = []
+    seen: Set[str] = set()
+    for root in manifests:
+        if root.jigsaw.id in seen:
+            continue
+        seen.add(root.jigsaw.id)
+        stack = [(root, iter(root.jigsaw.requirements))]
+        while stack:
+            manifest, requirements = stack[-1]
+            for requirement in requirements:
+                dependency = resolved.get(requirement.id)
+                if dependency is not None and requirement.id not in seen:
+                    seen.add(requirement.id)
+                    stack.append((dependency, iter(dependency.jigsaw.requirements)))
+                    break
+            else:
+                stack.pop()
+                order.append(manifest)
+    return order
+
+
+def plugin_files(manifest: Manifest) -> List[str]:
+    """
+    Lists the source and bytecode files a plugin is likely to read while loading
+
+    :param manifest: The manifest of the plugin
+    :return: The paths of the files, main file first
+    """
+    paths = []
+    for source in plugin_sources(manifest):
+        paths.append(source)
+        try:
+            bytecode = importlib.util.cache_from_source(source)
+        except (NotImplementedError, ValueError):
+            continue
+        if os.path.exists(bytecode):
+            paths.append(bytecode)
+    return paths
+
+
+def warm(path: str) -> None:
+    """
+    Asks the OS to read a file into the page cache, or reads it if that is unsupported
+
+    :param path: The file to warm
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while os.read(fd, _READ_SIZE):
+                pass
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SourcePrefetcher:
+    """
+    Warms the page cache for upcoming plugins on a background thread
+
+    The thread stays at most ``window`` plugins ahead of the plugin currently being
+    loaded, so prefetching overlaps with loading without evicting what is needed next.
+    """
+
+    def __init__(self, order: Sequence[Manifest], window: int):
+        """
+        Initializes the prefetcher
+
+        :param order: The manifests in the order they will be loaded
+        :param window: How many plugins ahead of the current one to prefetch
+        """
+        self._order = list(order)
+        self._positions: Dict[str, int] = {
+            manifest.jigsaw.id: index for index, manifest in enumerate(self._order)
+        }
+        self._window = window
+        self._current = -1
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._logger = logging.getLogger("Jigsaw")
+
+        self.warmed: List[str] = []
+
+    def _run(self) -> None:
+        for index, manifest in enumerate(self._order):
+            with self._condition:
+                while not self._stopped and index > self._current + self._window:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                if index < self._current:
+                    # The loader already overtook the prefetcher here
+                    continue
+            for path in plugin_files(manifest):
+                warm(path)
+            self.warmed.append(manifest.jigsaw.id)
+        self._logger.debug(
+            "Prefetched sources for {} plugins.".format(len(self._order))
+        )
+
+    def start(self) -> None:
+        """
+        Starts prefetching on a background thread
+        """
+        self._thread = threading.Thread(
+            target=self._run, name="jigsaw-prefetch", daemon=True
+        )
+        self._thread.start()
+
+    def advance(self, plugin_id: str) -> None:
+        """
+        Notes that a plugin has started loading, letting the prefetcher move ahead
+
+        :param plugin_id: The ID of the plugin being loaded
+        """
+        position = self._positions.get(plugin_id)
+        if position is None:
+            return
+        with self._condition:
+            if position > self._current:
+                self._current = position
+                self._condition.notify()
+
+    def stop(self) -> None:
+        """
+        Stops prefetching and waits for the background thread to exit
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,390 @@
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from importlib.machinery import ModuleSpec
+from types import ModuleType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+from .critical_path import CriticalPathAnalysis
+from .listeners import LoaderListener
+from .plugin_loader import PluginLoader
+from .types import Manifest
+
+
+class PluginTiming(NamedTuple):
+    """
+    Startup costs measured for a single plugin, excluding its dependencies
+    """
+
+    id: str
+    load: float
+    enable: float
+    memory: int
+
+    @property
+    def total(self) -> float:
+        return self.load + self.enable
+
+
+class ImportTiming(NamedTuple):
+    """
+    Time spent executing a module imported while loading a plugin
+    """
+
+    plugin_id: str
+    module: str
+    self_time: float
+    cumulative: float
+
+
+class _Frame:
+    __slots__ = ("name", "start", "children", "memory", "child_memory")
+
+    def __init__(self, name: str, memory: int = 0):
+        self.name = name
+        self.start = time.perf_counter()
+        self.children = 0.0
+        self.memory = memory
+        self.child_memory = 0
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """
+    Wraps a module loader to time module execution
+    """
+
+    def __init__(self, loader: Any, profiler: "StartupProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec: ModuleSpec) -> Optional[ModuleType]:
+        module: Optional[ModuleType] = self._loader.create_module(spec)
+        return module
+
+    def exec_module(self, module: ModuleType) -> None:
+        frame = self._profiler._push_import(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._pop_import(frame)
+            # Hand the module back to its real loader so it is not timed again later
+            module.__loader__ = self._loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self._loader
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that wraps the loaders found by the other finders in a _TimedLoader
+    """
+
+    def __init__(self, profiler: "StartupProfiler"):
+        self._profiler = profiler
+        self._delegating = False
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[str]],
+        target: Optional[ModuleType] = None,
+    ) -> Optional[ModuleSpec]:
+        if not self._profiler._plugin_stack or self._delegating:
+            return None
+        # Delegating finders such as the import guard may call back into this one
+        self._delegating = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec: Optional[ModuleSpec] = finder.find_spec(fullname, path, target)
+                if spec is None:
+                    continue
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self._profiler)
+                return spec
+            return None
+        finally:
+            self._delegating = False
+
+
+class StartupProfile:
+    """
+    The results of profiling plugin startup
+    """
+
+    def __init__(
+        self,
+        phases: Dict[str, float],
+        plugins: Dict[str, PluginTiming],
+        imports: List[ImportTiming],
+        analysis: CriticalPathAnalysis,
+        events: List[Dict[str, Any]],
+    ):
+        """
+        Initializes the profile
+
+        :param phases: Wall time of each startup phase
+        :param plugins: Per plugin costs, keyed by ID
+        :param imports: Timings of all modules imported by plugins
+        :param analysis: Critical path analysis of the dependency graph
+        :param events: Chrome trace events recorded during startup
+        """
+        self.phases = phases
+        self.plugins = plugins
+        self.imports = imports
+        self.analysis = analysis
+        self.events = events
+
+    @property
+    def critical_path(self) -> List[str]:
+        return self.analysis.path
+
+    def slowest_plugins(self, count: int = 10) -> List[PluginTiming]:
+        """
+        Gets the plugins with the highest startup cost
+
+        :param count: The number of plugins to return
+        :return: The slowest plugins, slowest first
+        """
+        return sorted(self.plugins.values(), key=lambda i: i.total, reverse=True)[
+            :count
+        ]
+
+    def import_hotspots(self, count: int = 10) -> List[ImportTiming]:
+        """
+        Gets the imported modules that took the longest to execute
+
+        :param count: The number of modules to return
+        :return: The slowest modules by self time, slowest first
+        """
+        return sorted(self.imports, key=lambda i: i.self_time, reverse=True)[:count]
+
+    def largest_plugins(self, count: int = 10) -> List[PluginTiming]:
+        """
+        Gets the plugins retaining the most memory after loading
+
+        :param count: The number of plugins to return
+        :return: The largest plugins, largest first
+        """
+        return sorted(self.plugins.values(), key=lambda i: i.memory, reverse=True)[
+            :count
+        ]
+
+    def format_report(self, count: int = 10) -> str:
+        """
+        Formats the profile as a human readable report
+
+        :param count: The number of entries to show in each ranking
+        :return: The report
+        """
+        lines = ["Startup phases:"]
+        for phase, duration in self.phases.items():
+            lines.append("  {:<30} {:>10.2f} ms".format(phase, duration * 1000))
+
+        lines.append("")
+        lines.append("Slowest plugins:")
+        lines.append(
+            "  {:<30} {:>10} {:>10} {:>10}".format("plugin", "load", "enable", "total")
+        )
+        for plugin in self.slowest_plugins(count):
+            lines.append(
+                "  {:<30} {:>7.2f} ms {:>7.2f} ms {:>7.2f} ms".format(
+                    plugin.id,
+                    plugin.load * 1000,
+                    plugin.enable * 1000,
+                    plugin.total * 1000,
+                )
+            )
+
+        lines.append("")
+        lines.append("Import hotspots:")
+        lines.append(
+            "  {:<30} {:<30} {:>10} {:>10}".format(
+                "plugin", "module", "self", "cumulative"
+            )
+        )
+        for item in self.import_hotspots(count):
+            lines.append(
+                "  {:<30} {:<30} {:>7.2f} ms {:>7.2f} ms".format(
+                    item.plugin_id,
+                    item.module,
+                    item.self_time * 1000,
+                    item.cumulative * 1000,
+                )
+            )
+
+        lines.append("")
+        lines.append("Retained memory:")
+        for plugin in self.largest_plugins(count):
+            lines.append(
+                "  {:<30} {:>10.1f} KiB".format(plugin.id, plugin.memory / 1024)
+            )
+
+        lines.append("")
+        lines.append(self.analysis.format_report())
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """
+        Gets the profile in the Chrome trace event format
+
+        :return: The trace, ready to be serialized as JSON
+        """
+        return {"traceEvents": self.events, "displayTimeUnit": "ms"}
+
+
+class StartupProfiler(LoaderListener):
+    """
+    Runs plugin discovery, resolution, loading and enabling under instrumentation
+
+    Plugins are loaded through the loader's own load_plugins, so resolution, load order
+    and prefetching match a normal startup.
+    """
+
+    def __init__(self, loader: PluginLoader):
+        """
+        Initializes the profiler
+
+        :param loader: The plugin loader to profile
+        """
+        self._loader = loader
+        self._logger = logging.getLogger("Jigsaw")
+
+        self._origin = 0.0
+        self._events: List[Dict[str, Any]] = []
+        self._plugin_stack: List[_Frame] = []
+        self._import_stack: List[_Frame] = []
+        self._memory: Dict[str, int] = {}
+        self._load_order: List[str] = []
+        self._imports: List[ImportTiming] = []
+        self._enable_starts: Dict[str, float] = {}
+        self._phases: Dict[str, float] = {}
+        self._phase_start = 0.0
+
+    def _event(self, name: str, category: str, start: float, end: float) -> None:
+        self._events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+        )
+
+    def _push_import(self, module: str) -> _Frame:
+        frame = _Frame(module)
+        self._import_stack.append(frame)
+        return frame
+
+    def _pop_import(self, frame: _Frame) -> None:
+        end = time.perf_counter()
+        self._import_stack.pop()
+        cumulative = end - frame.start
+        if self._import_stack:
+            self._import_stack[-1].children += cumulative
+        self._imports.append(
+            ImportTiming(
+                self._plugin_stack[-1].name if self._plugin_stack else "",
+                frame.name,
+                cumulative - frame.children,
+                cumulative,
+            )
+        )
+        self._event(frame.name, "import", frame.start, end)
+
+    def manifests_resolved(self, resolved: Mapping[str, Manifest]) -> None:
+        if "resolution" not in self._phases:
+            self._phase("resolution")
+
+    def load_started(self, manifest: Manifest) -> None:
+        frame = _Frame(manifest.jigsaw.id, tracemalloc.get_traced_memory()[0])
+        self._plugin_stack.append(frame)
+
+    def load_finished(self, manifest: Manifest) -> None:
+        plugin_id = manifest.jigsaw.id
+        end = time.perf_counter()
+        frame = self._plugin_stack.pop()
+        memory = tracemalloc.get_traced_memory()[0] - frame.memory
+        if self._plugin_stack:
+            self._plugin_stack[-1].child_memory += memory
+        self._memory[plugin_id] = memory - frame.child_memory
+        if self._loader.get_plugin_loaded(plugin_id):
+            self._load_order.append(plugin_id)
+        self._event(plugin_id, "load", frame.start, end)
+
+    def enable_started(self, plugin_id: str) -> None:
+        self._enable_starts[plugin_id] = time.perf_counter()
+
+    def enable_finished(self, plugin_id: str) -> None:
+        start = self._enable_starts.pop(plugin_id)
+        self._event(plugin_id, "enable", start, time.perf_counter())
+
+    def _phase(self, name: str) -> None:
+        end = time.perf_counter()
+        self._phases[name] = end - self._phase_start
+        self._event(name, "phase", self._phase_start, end)
+        self._phase_start = end
+
+    def run(self, *args: Any) -> StartupProfile:
+        """
+        Discovers, resolves, loads and enables all plugins while recording their costs
+
+        :param args: Arguments to pass to the plugins
+        :return: The recorded profile
+        """
+        timer = _ImportTimer(self)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        self._loader.add_listener(self)
+        sys.meta_path.insert(0, timer)
+
+        try:
+            self._origin = self._phase_start = time.perf_counter()
+            self._loader.load_manifests()
+            self._phase("discovery")
+
+            # Resolution happens inside load_plugins and ends its phase when notified
+            self._loader.load_plugins(*args)
+            self._phase("load")
+
+            for plugin_id in self._load_order:
+                try:
+                    self._loader.enable_plugin(plugin_id)
+                except Exception:
+                    self._logger.exception(
+                        "Failed to enable plugin {}.".format(plugin_id)
+                    )
+            self._phase("enable")
+        finally:
+            sys.meta_path.remove(timer)
+            self._loader.remove_listener(self)
+            if not tracing:
+                tracemalloc.stop()
+
+        plugins = {
+            plugin_id: PluginTiming(
+                plugin_id,
+                self._loader.get_load_cost(plugin_id) or 0.0,
+                self._loader.get_enable_cost(plugin_id) or 0.0,
+                self._memory[plugin_id],
+            )
+            for plugin_id in self._load_order
+        }
+        return StartupProfile(
+            self._phases,
+            plugins,
+            self._imports,
+            self._loader.analyze_critical_path(),
+            self._events,
+        )
@@ -0,0 +1,73 @@
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .types import Manifest
+
+Fingerprint = Tuple[int, int, int]
+
+
+class ManifestChanges(NamedTuple):
+    """
+    The difference between the loaded manifests and the manifests on disk
+    """
+
+    added: List[Manifest]
+    removed: List[Manifest]
+    changed: List[Tuple[Manifest, Manifest]]
+    unchanged: List[Manifest]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def plugin_sources(manifest: Manifest) -> List[str]:
+    """
+    Lists the Python source files of a plugin
+
+    :param manifest: The manifest of the plugin
+    :return: The paths of the files, main file first
+    """
+    main_file = os.path.join(manifest.jigsaw.path, manifest.jigsaw.main_file)
+    sources = [main_file]
+    for root, dirs, files in os.walk(manifest.jigsaw.path):
+        dirs[:] = sorted(i for i in dirs if i != "__pycache__")
+        sources.extend(
+            os.path.join(root, i)
+            for i in sorted(files)
+            if i.endswith(".py") and os.path.join(root, i) != main_file
+        )
+    return sources
+
+
+def fingerprint(stat: os.stat_result) -> Fingerprint:
+    """
+    Gets a fingerprint that changes whenever a manifest file is rewritten or replaced
+
+    :param stat: The stat result of the manifest file
+    :return: The fingerprint
+    """
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def scan_plugin_dirs(plugin_paths: Iterable[str]) -> Dict[str, Optional[Fingerprint]]:
+    """
+    Fingerprints the manifest of every plugin folder on the plugin paths
+
+    Directory entries come from os.scandir, which usually knows whether an entry is a
+    folder without a stat call, so the scan costs about one stat per plugin.
+
+    :param plugin_paths: The paths to scan
+    :return: The manifest fingerprint of each plugin folder, None if it has no manifest
+    """
+    fingerprints: Dict[str, Optional[Fingerprint]] = {}
+    for path in plugin_paths:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                try:
+                    stat = os.stat(os.path.join(entry.path, "plugin.toml"))
+                    fingerprints[entry.path] = fingerprint(stat)
+                except OSError:
+                    fingerprints[entry.path] = None
+    return fingerprints
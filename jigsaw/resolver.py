@@ -0,0 +1,285 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .types import Manifest
+from .versions import Requirement, Version
+
+_POP, _PUSH, _SELECT, _CONSTRAIN = range(4)
+
+
+class ResolutionError(Exception):
+    """
+    Raised when no consistent set of manifests satisfies the requested dependencies
+    """
+
+    pass
+
+
+class _Candidate:
+    __slots__ = ("manifest", "version", "requirements")
+
+    def __init__(self, manifest: Manifest):
+        self.manifest = manifest
+        self.version: Optional[Version] = manifest.jigsaw.parsed_version
+        self.requirements: Tuple[Requirement, ...] = tuple(manifest.jigsaw.requirements)
+
+
+class _Decision:
+    __slots__ = ("plugin_id", "options", "position", "mark", "conflicts")
+
+    def __init__(self, plugin_id: str, options: List[int], mark: int):
+        self.plugin_id = plugin_id
+        self.options = options
+        self.position = 0
+        self.mark = mark
+        # Earlier decisions that took part in rejecting this decision's options
+        self.conflicts: Set[int] = set()
+
+
+def candidate_key(manifest: Manifest) -> Tuple[bool, Version]:
+    """
+    Sort key ranking manifests of the same plugin, newest first and unversioned last
+
+    :param manifest: The manifest to rank
+    :return: The sort key for the manifest
+    """
+    version = manifest.jigsaw.parsed_version
+    return version is not None, version or Version(())
+
+
+class Resolver:
+    """
+    Selects one manifest per plugin such that every dependency specifier is satisfied
+    """
+
+    def __init__(self, manifests: Iterable[Manifest]):
+        """
+        Initializes the resolver
+
+        :param manifests: All available manifests, in plugin path order
+        """
+        self._candidates: Dict[str, List[_Candidate]] = {}
+        for manifest in manifests:
+            self._candidates.setdefault(manifest.jigsaw.id, []).append(
+                _Candidate(manifest)
+            )
+        for candidates in self._candidates.values():
+            # Stable sort, so plugin path order breaks ties between equal versions
+            candidates.sort(key=lambda c: candidate_key(c.manifest), reverse=True)
+
+    def _options(
+        self, plugin_id: str, constraints: Dict[str, List[Tuple[Requirement, int]]]
+    ) -> List[int]:
+        requirements = constraints.get(plugin_id, ())
+        return [
+            index
+            for index, candidate in enumerate(self._candidates.get(plugin_id, ()))
+            if all(r.matches(candidate.version) for r, _ in requirements)
+        ]
+
+    def _prune(self) -> Dict[str, str]:
+        """
+        Drops candidates with a dependency that no remaining candidate meets
+
+        A plugin is only checked again when one of its dependencies lost candidates,
+        so long dependency chains are pruned in a single pass.
+
+        :return: Reasons for every plugin left without candidates, keyed by ID
+        """
+        dependents: Dict[str, Set[str]] = {}
+        for plugin_id, options in self._candidates.items():
+            for candidate in options:
+                for requirement in candidate.requirements:
+                    dependents.setdefault(requirement.id, set()).add(plugin_id)
+
+        failures = {}
+        worklist = list(self._candidates)
+        queued = set(worklist)
+        while worklist:
+            plugin_id = worklist.pop()
+            queued.discard(plugin_id)
+            candidates = self._candidates.get(plugin_id)
+            if candidates is None:
+                continue
+            viable = []
+            reason = ""
+            for candidate in candidates:
+                for requirement in candidate.requirements:
+                    if not any(
+                        requirement.matches(c.version)
+                        for c in self._candidates.get(requirement.id, ())
+                    ):
+                        reason = "no manifest satisfies dependency {}".format(
+                            requirement
+                        )
+                        break
+                else:
+                    viable.append(candidate)
+            if len(viable) == len(candidates):
+                continue
+            if viable:
+                self._candidates[plugin_id] = viable
+            else:
+                del self._candidates[plugin_id]
+                failures[plugin_id] = reason
+            for dependent in dependents.get(plugin_id, ()):
+                if dependent not in queued:
+                    queued.add(dependent)
+                    worklist.append(dependent)
+        return failures
+
+    def _search(
+        self, requirements: Iterable[Requirement], selected: Dict[str, int]
+    ) -> None:
+        """
+        Extends a selection of candidates so that it satisfies the given requirements
+
+        Candidates are tried newest first. Each choice checks that every dependency it
+        constrains still has a viable candidate, so dead ends are abandoned as soon as
+        they appear. Every constraint remembers the decision that imposed it, and when
+        a plugin runs out of candidates the search jumps straight back to the latest
+        decision involved in the conflict, skipping unrelated decisions in between.
+        Changes are recorded on a trail and undone when backtracking, which keeps the
+        search free of recursion and state copies.
+
+        :param requirements: The plugins that must be part of the selection
+        :param selected: The selected candidate index of each plugin, keyed by ID.
+            Existing selections are kept, and the selection is unchanged on failure.
+        :raises ResolutionError: If the requirements cannot be satisfied
+        """
+        levels: Dict[str, int] = {}
+        constraints: Dict[str, List[Tuple[Requirement, int]]] = {}
+        pending: List[str] = []
+        trail: List[Tuple[int, str]] = []
+        culprits: Set[int] = set()
+        conflict = ""
+
+        def undo(mark: int) -> None:
+            while len(trail) > mark:
+                kind, value = trail.pop()
+                if kind == _POP:
+                    pending.append(value)
+                elif kind == _PUSH:
+                    pending.pop()
+                elif kind == _SELECT:
+                    del selected[value]
+                    del levels[value]
+                else:
+                    constraints[value].pop()
+
+        def constrain(requirement: Requirement, level: int) -> bool:
+            nonlocal conflict
+            plugin_id = requirement.id
+            constraints.setdefault(plugin_id, []).append((requirement, level))
+            trail.append((_CONSTRAIN, plugin_id))
+            if plugin_id in selected:
+                candidate = self._candidates[plugin_id][selected[plugin_id]]
+                if requirement.matches(candidate.version):
+                    return True
+                # Selections made before this search are fixed, like the requirements
+                culprits.add(levels.get(plugin_id, -1))
+            elif self._options(plugin_id, constraints):
+                pending.append(plugin_id)
+                trail.append((_PUSH, plugin_id))
+                return True
+            else:
+                culprits.update(i for _, i in constraints[plugin_id])
+            conflict = "no manifest satisfies {}".format(
+                ", ".join(str(r) for r, _ in constraints[plugin_id])
+            )
+            return False
+
+        def select(plugin_id: str, index: int, level: int) -> bool:
+            selected[plugin_id] = index
+            levels[plugin_id] = level
+            trail.append((_SELECT, plugin_id))
+            candidate = self._candidates[plugin_id][index]
+            return all(constrain(r, level) for r in candidate.requirements)
+
+        for requirement in requirements:
+            if not constrain(requirement, -1):
+                undo(0)
+                raise ResolutionError(conflict)
+
+        # Decisions are numbered by their position on this stack
+        decisions: List[_Decision] = []
+        while True:
+            plugin_id = None
+            while pending:
+                top = pending.pop()
+                trail.append((_POP, top))
+                if top not in selected:
+                    plugin_id = top
+                    break
+            if plugin_id is None:
+                return
+
+            decisions.append(
+                _Decision(plugin_id, self._options(plugin_id, constraints), len(trail))
+            )
+            while decisions:
+                level = len(decisions) - 1
+                decision = decisions[-1]
+                undo(decision.mark)
+                if decision.position < len(decision.options):
+                    index = decision.options[decision.position]
+                    decision.position += 1
+                    culprits.clear()
+                    if select(decision.plugin_id, index, level):
+                        break
+                    decision.conflicts.update(i for i in culprits if i < level)
+                    continue
+
+                # Out of candidates, which also involves whatever constrained the plugin
+                decision.conflicts.update(
+                    i for _, i in constraints[decision.plugin_id] if i < level
+                )
+                target = max(decision.conflicts, default=-1)
+                del decisions[target + 1 :]
+                if decisions:
+                    decisions[-1].conflicts.update(
+                        i for i in decision.conflicts if i < target
+                    )
+            else:
+                undo(0)
+                raise ResolutionError(conflict)
+
+    def resolve(self, requirements: Iterable[Requirement]) -> Dict[str, Manifest]:
+        """
+        Resolves a consistent set of manifests for the given requirements
+
+        :param requirements: The plugins that must be part of the result
+        :return: The selected manifest for every required plugin, keyed by ID
+        :raises ResolutionError: If the requirements cannot be satisfied
+        """
+        selected: Dict[str, int] = {}
+        self._search(requirements, selected)
+        return self._manifests(selected)
+
+    def resolve_all(self) -> Tuple[Dict[str, Manifest], Dict[str, str]]:
+        """
+        Resolves as many plugins as possible, dropping those that cannot be satisfied
+
+        :return: The selected manifests and the reasons for dropped plugins, keyed by ID
+        """
+        failures = self._prune()
+        roots = [Requirement(plugin_id) for plugin_id in self._candidates]
+        selected: Dict[str, int] = {}
+        try:
+            self._search(roots, selected)
+        except ResolutionError:
+            # Some plugins conflict; admit them one by one so only the latecomer is
+            # dropped. Earlier selections stay fixed, so each plugin only extends them.
+            for root in roots:
+                if root.id in selected:
+                    continue
+                try:
+                    self._search([root], selected)
+                except ResolutionError as e:
+                    failures[root.id] = str(e)
+        return self._manifests(selected), failures
+
+    def _manifests(self, selected: Dict[str, int]) -> Dict[str, Manifest]:
+        return {
+            plugin_id: self._candidates[plugin_id][index].manifest
+            for plugin_id, index in selected.items()
+        }
@@ -0,0 +1,290 @@
+import importlib.abc
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from importlib.machinery import ModuleSpec
+from types import ModuleType
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .types import ImportPolicy, Manifest
+
+_DENIED, _ALLOWED, _LOCAL, _UNLISTED = range(4)
+
+# Deep enough to attribute allocations made through library code to the importer
+_TRACEBACK_FRAMES = 8
+
+# tracemalloc is process wide, so it is only stopped once no guard needs it any more
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_started_tracing = False
+
+
+class ImportPolicyViolation(ImportError):
+    """
+    Raised when a plugin imports a module its import policy does not permit
+    """
+
+    pass
+
+
+def _matches(module: str, patterns: Sequence[str]) -> bool:
+    return any(module == i or module.startswith(i + ".") for i in patterns)
+
+
+class _Scope:
+    __slots__ = ("id", "path", "policy", "memory", "snapshot", "files")
+
+    def __init__(
+        self,
+        manifest: Manifest,
+        memory: int,
+        snapshot: Optional[tracemalloc.Snapshot],
+    ):
+        self.id = manifest.jigsaw.id
+        self.path = os.path.join(os.path.abspath(manifest.jigsaw.path), "")
+        self.policy: ImportPolicy = manifest.jigsaw.imports
+        self.memory = memory
+        self.snapshot = snapshot
+        # Source files of the modules imported in this scope
+        self.files: Set[str] = set()
+
+
+class _ThreadState(threading.local):
+    def __init__(self) -> None:
+        self.scopes: List[_Scope] = []
+        self.depth = 0
+        self.delegating = False
+
+
+def _start_tracing() -> None:
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(_TRACEBACK_FRAMES)
+            _started_tracing = True
+        _tracing_users += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class _GuardedLoader(importlib.abc.Loader):
+    """
+    Wraps a module loader to track nested imports and the memory they allocate
+    """
+
+    def __init__(self, loader: Any, guard: "ImportGuard", nests: bool):
+        """
+        Initializes the loader
+
+        :param loader: The loader to wrap
+        :param guard: The guard that found the module
+        :param nests: Whether imports made by the module count as nested imports
+        """
+        self._loader = loader
+        self._guard = guard
+        self._nests = nests
+
+    def create_module(self, spec: ModuleSpec) -> Optional[ModuleType]:
+        module: Optional[ModuleType] = self._loader.create_module(spec)
+        return module
+
+    def exec_module(self, module: ModuleType) -> None:
+        state = self._guard._state
+        if state.scopes and module.__spec__ is not None and module.__spec__.origin:
+            state.scopes[-1].files.add(module.__spec__.origin)
+        depth = 1 if self._nests else 0
+        state.depth += depth
+        try:
+            self._loader.exec_module(module)
+        finally:
+            state.depth -= depth
+            module.__loader__ = self._loader
+            if module.__spec__ is not None:
+                module.__spec__.loader = self._loader
+        if state.depth == 0:
+            self._guard._check_memory(module.__name__)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+
+class ImportGuard(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder enforcing the import policy of the plugin currently being loaded
+
+    Policies only apply to modules that are not imported yet, as modules already in
+    sys.modules never reach the meta path. Modules imported by a module on the allowed
+    list are allowed unless denied. Modules inside the plugin's own folder are always
+    allowed, but their own imports are checked like imports from the main file.
+
+    Policies are tracked per thread, so imports made by other threads while a plugin
+    loads are left alone.
+    """
+
+    def __init__(self) -> None:
+        self._decisions: Dict[Tuple[str, str], int] = {}
+        self._state = _ThreadState()
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def _find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[str]],
+        target: Optional[ModuleType],
+    ) -> Optional[ModuleSpec]:
+        self._state.delegating = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec: Optional[ModuleSpec] = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    return spec
+            return None
+        finally:
+            self._state.delegating = False
+
+    def _decide(self, scope: _Scope, fullname: str, spec: Optional[ModuleSpec]) -> int:
+        if _matches(fullname, scope.policy.denied):
+            return _DENIED
+        if scope.policy.allowed is None or _matches(fullname, scope.policy.allowed):
+            return _ALLOWED
+        if spec is not None and spec.origin and spec.origin.startswith(scope.path):
+            return _LOCAL
+        return _UNLISTED
+
+    def _allocated(self, scope: _Scope, snapshot: tracemalloc.Snapshot) -> int:
+        # Allocations count when any frame of their traceback is in one of the modules
+        return sum(
+            statistic.size
+            for statistic in snapshot.statistics("traceback")
+            if any(
+                frame.filename.startswith(scope.path) or frame.filename in scope.files
+                for frame in statistic.traceback
+            )
+        )
+
+    def _memory_used(self, scope: _Scope) -> int:
+        assert scope.snapshot is not None
+        snapshot = tracemalloc.take_snapshot()
+        return self._allocated(scope, snapshot) - self._allocated(scope, scope.snapshot)
+
+    def _check_memory(self, fullname: str) -> None:
+        scope = self._state.scopes[-1]
+        if scope.policy.max_memory is None:
+            return
+        # Other threads allocate too, so process wide growth only bounds what the
+        # plugin used; the allocations made by its own modules are counted only once
+        # that bound exceeds the limit
+        used = tracemalloc.get_traced_memory()[0] - scope.memory
+        if used <= scope.policy.max_memory:
+            return
+        used = self._memory_used(scope)
+        if used > scope.policy.max_memory:
+            raise ImportPolicyViolation(
+                "Plugin {} exceeded its import memory limit of {} bytes "
+                "({} bytes) after importing {}.".format(
+                    scope.id, scope.policy.max_memory, used, fullname
+                ),
+                name=fullname,
+            )
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[str]],
+        target: Optional[ModuleType] = None,
+    ) -> Optional[ModuleSpec]:
+        state = self._state
+        if not state.scopes or state.delegating:
+            return None
+        scope = state.scopes[-1]
+        key = (scope.id, fullname)
+
+        spec = None
+        decision = self._decisions.get(key)
+        if decision is None:
+            decision = self._decide(scope, fullname, None)
+            if decision == _UNLISTED:
+                spec = self._find_spec(fullname, path, target)
+                decision = self._decide(scope, fullname, spec)
+            self._decisions[key] = decision
+
+        if decision == _DENIED:
+            raise ImportPolicyViolation(
+                "Plugin {} is not permitted to import {}.".format(scope.id, fullname),
+                name=fullname,
+            )
+        if decision == _UNLISTED and state.depth == 0:
+            raise ImportPolicyViolation(
+                "Plugin {} imported {}, which is not in its allowed imports.".format(
+                    scope.id, fullname
+                ),
+                name=fullname,
+            )
+        if scope.policy.allowed is None and scope.policy.max_memory is None:
+            return None
+
+        # Nested imports and memory use are only visible by wrapping the module loader
+        if spec is None:
+            spec = self._find_spec(fullname, path, target)
+        if spec is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _GuardedLoader(spec.loader, self, decision == _ALLOWED)
+        return spec
+
+    def forget(self, plugin_id: str) -> None:
+        """
+        Discards the memoized decisions for a plugin, for use when its policy changes
+
+        :param plugin_id: The ID of the plugin
+        """
+        for key in [i for i in self._decisions if i[0] == plugin_id]:
+            del self._decisions[key]
+
+    @contextmanager
+    def enforce(self, manifest: Manifest) -> Iterator[None]:
+        """
+        Enforces the import policy of a manifest for the duration of the context
+
+        :param manifest: The manifest of the plugin being loaded
+        """
+        policy = manifest.jigsaw.imports
+        if (
+            policy.allowed is None
+            and len(policy.denied) == 0
+            and policy.max_memory is None
+        ):
+            yield
+            return
+
+        snapshot = None
+        if policy.max_memory is not None:
+            _start_tracing()
+            snapshot = tracemalloc.take_snapshot()
+        memory = tracemalloc.get_traced_memory()[0]
+        with self._lock:
+            if self._active == 0:
+                sys.meta_path.insert(0, self)
+            self._active += 1
+        scopes = self._state.scopes
+        scopes.append(_Scope(manifest, memory, snapshot))
+        try:
+            yield
+        finally:
+            scopes.pop()
+            with self._lock:
+                self._active -= 1
+                if self._active == 0:
+                    sys.meta_path.remove(self)
+            if policy.max_memory is not None:
+                _stop_tracing()
@@ -0,0 +1,266 @@
+import logging
+from collections import Counter
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Tuple, Type
+
+from .rescan import Fingerprint
+from .resolver import ResolutionError, Resolver
+from .types import Manifest
+from .versions import Requirement
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .plugin_loader import PluginLoader
+
+
+class TransactionError(Exception):
+    """
+    Raised when a plugin transaction fails validation or cannot be committed
+    """
+
+    pass
+
+
+def dependency_batches(manifests: Mapping[str, Manifest]) -> List[List[str]]:
+    """
+    Groups plugins into batches that only depend on plugins in earlier batches
+
+    Dependencies on plugins that are not in the mapping are ignored.
+
+    :param manifests: The manifests of the plugins to group, keyed by ID
+    :return: The batches, in dependency order
+    """
+    remaining = {
+        plugin_id: {i.id for i in manifest.jigsaw.requirements if i.id in manifests}
+        for plugin_id, manifest in manifests.items()
+    }
+    batches = []
+    while remaining:
+        batch = [plugin_id for plugin_id, deps in remaining.items() if not deps]
+        if not batch:
+            raise TransactionError(
+                "Dependency cycle between {}.".format(", ".join(sorted(remaining)))
+            )
+        for plugin_id in batch:
+            del remaining[plugin_id]
+        for deps in remaining.values():
+            deps.difference_update(batch)
+        batches.append(batch)
+    return batches
+
+
+class PluginTransaction:
+    """
+    A set of plugin loads, unloads and reloads that is applied all at once or not at all
+    """
+
+    def __init__(self, loader: "PluginLoader", *args: Any):
+        """
+        Initializes the transaction
+
+        :param loader: The plugin loader to apply the transaction to
+        :param args: Arguments to pass to loaded plugins
+        """
+        self._loader = loader
+        self._args = args
+        self._logger = logging.getLogger("Jigsaw")
+
+        self._loads: Dict[str, Manifest] = {}
+        self._unloads: List[str] = []
+        self._reloads: List[str] = []
+
+    def load(self, manifest: Manifest) -> None:
+        """
+        Stages loading a plugin, along with any dependencies that are not loaded yet
+
+        :param manifest: The manifest of the plugin to load
+        """
+        self._loads[manifest.jigsaw.id] = manifest
+
+    def unload(self, id: str) -> None:
+        """
+        Stages unloading a plugin and removing its manifest
+
+        :param id: The ID of the plugin
+        """
+        self._unloads.append(id)
+
+    def reload(self, id: str) -> None:
+        """
+        Stages reloading a plugin and its manifest from the disk
+
+        :param id: The ID of the plugin
+        """
+        self._reloads.append(id)
+
+    def _plan(
+        self,
+    ) -> Tuple[Dict[str, Manifest], Dict[str, Tuple[Manifest, Fingerprint]]]:
+        loader = self._loader
+        errors = []
+
+        staged = Counter(list(self._loads) + self._unloads + self._reloads)
+        for plugin_id in [i for i, count in staged.items() if count > 1]:
+            errors.append("{} is staged more than once".format(plugin_id))
+        for plugin_id in self._unloads + self._reloads:
+            if not loader.get_plugin_loaded(plugin_id):
+                errors.append("{} is not loaded".format(plugin_id))
+        for plugin_id in self._loads:
+            if loader.get_plugin_loaded(plugin_id):
+                errors.append("{} is already loaded".format(plugin_id))
+
+        fresh: Dict[str, Tuple[Manifest, Fingerprint]] = {}
+        for plugin_id in self._reloads:
+            plugin = loader.get_plugin(plugin_id)
+            if plugin is None:
+                continue
+            result = loader._read_manifest(plugin.manifest.jigsaw.path)
+            if result is None:
+                errors.append("the manifest of {} could not be read".format(plugin_id))
+            elif result[0].jigsaw.id != plugin_id:
+                errors.append("the manifest of {} changed its ID".format(plugin_id))
+            else:
+                fresh[plugin_id] = result
+
+        # Plugins that stay loaded are pinned to their current manifest
+        pinned = {
+            plugin_id: plugin.manifest
+            for plugin_id, plugin in loader._plugins.items()
+            if plugin_id not in self._unloads
+        }
+        pinned.update((i, result[0]) for i, result in fresh.items())
+        pinned.update(self._loads)
+        pool = list(pinned.values()) + [
+            manifest
+            for manifest in loader._manifests
+            if manifest.jigsaw.id not in pinned
+            and manifest.jigsaw.id not in self._unloads
+        ]
+        selection: Dict[str, Manifest] = {}
+        try:
+            selection = Resolver(pool).resolve(Requirement(i) for i in pinned)
+        except ResolutionError as e:
+            errors.append("dependencies cannot be satisfied: {}".format(e))
+
+        if errors:
+            raise TransactionError(
+                "Transaction is invalid: {}.".format("; ".join(errors))
+            )
+        to_load = {
+            plugin_id: manifest
+            for plugin_id, manifest in selection.items()
+            if plugin_id in fresh or not loader.get_plugin_loaded(plugin_id)
+        }
+        return to_load, fresh
+
+    def validate(self) -> List[List[str]]:
+        """
+        Checks that the staged changes leave all plugin dependencies satisfied
+
+        :return: The plugins that will be loaded, in dependency ordered batches
+        :raises TransactionError: If the transaction is invalid
+        """
+        to_load, _ = self._plan()
+        return dependency_batches(to_load)
+
+    def commit(self) -> None:
+        """
+        Applies the staged changes
+
+        New plugin instances are created first, while the current ones keep running.
+        Only once all of them loaded are the replaced and unloaded plugins disabled and
+        the new ones enabled. If anything fails, the loader is restored to its previous
+        plugin instances and modules, without importing anything again.
+
+        :raises TransactionError: If the transaction is invalid or was rolled back
+        """
+        loader = self._loader
+        to_load, fresh = self._plan()
+        batches = dependency_batches(to_load)
+        snapshot = loader._snapshot()
+        replaced = {
+            plugin_id: snapshot.plugins[plugin_id]
+            for plugin_id in self._unloads + self._reloads
+        }
+        disabled: List[str] = []
+        enabled: List[str] = []
+        self._logger.debug("Committing transaction in {} batches.".format(len(batches)))
+
+        try:
+            for plugin_id, (manifest, fingerprint) in fresh.items():
+                old = replaced[plugin_id].manifest
+                loader._remove_plugin(plugin_id)
+                loader._reimport.add(plugin_id)
+                # A rescan may already have replaced the old manifest
+                loader._manifests = [
+                    manifest if i is old or i.jigsaw.path == old.jigsaw.path else i
+                    for i in loader._manifests
+                ]
+                loader._fingerprints[manifest.jigsaw.path] = fingerprint
+            loader._resolved = {}
+
+            order = [to_load[plugin_id] for batch in batches for plugin_id in batch]
+            with loader.prefetching(order):
+                for manifest in order:
+                    loader.load_plugin(manifest, *self._args)
+                    if not loader.get_plugin_loaded(manifest.jigsaw.id):
+                        raise TransactionError(
+                            "Plugin {} failed to load.".format(manifest.jigsaw.id)
+                        )
+
+            old_manifests = {i: plugin.manifest for i, plugin in replaced.items()}
+            for batch in reversed(dependency_batches(old_manifests)):
+                for plugin_id in batch:
+                    replaced[plugin_id].disable()
+                    disabled.append(plugin_id)
+            for plugin_id in self._unloads:
+                loader._remove_plugin(plugin_id)
+                old = old_manifests[plugin_id]
+                if any(i is old for i in loader._manifests):
+                    loader._manifests = [i for i in loader._manifests if i is not old]
+                    loader._fingerprints.pop(old.jigsaw.path, None)
+
+            for batch in batches:
+                for plugin_id in batch:
+                    loader.enable_plugin(plugin_id)
+                    enabled.append(plugin_id)
+        except Exception as e:
+            self._logger.error("Transaction failed, rolling back: {}".format(e))
+            self._rollback(snapshot.plugins, enabled, disabled)
+            loader._restore(snapshot)
+            if isinstance(e, TransactionError):
+                raise
+            raise TransactionError(
+                "Transaction failed and was rolled back: {}".format(e)
+            ) from e
+
+        self._logger.debug("Transaction committed.")
+
+    def _rollback(
+        self, plugins: Mapping[str, Any], enabled: List[str], disabled: List[str]
+    ) -> None:
+        for plugin_id in reversed(enabled):
+            try:
+                self._loader._plugins[plugin_id].disable()
+            except Exception:
+                self._logger.exception(
+                    "Failed to disable {} during rollback.".format(plugin_id)
+                )
+        for plugin_id in reversed(disabled):
+            try:
+                plugins[plugin_id].enable()
+            except Exception:
+                self._logger.exception(
+                    "Failed to re-enable {} during rollback.".format(plugin_id)
+                )
+
+    def __enter__(self) -> "PluginTransaction":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.commit()
@@ -1,6 +1,14 @@
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
+
+from .versions import Requirement, Version, parse_requirement, parse_version
+
+
+class ImportPolicy(BaseModel):
+    allowed: Optional[List[str]] = None
+    denied: List[str] = []
+    max_memory: Optional[int] = None
 
 
 class JigsawMeta(BaseModel):
@@ -14,6 +22,26 @@ class JigsawMeta(BaseModel):
     main_file: str = "__init__.py"
     main_class: str = "Plugin"
     path: str = ""
+    imports: ImportPolicy = ImportPolicy()
+
+    @validator("dependencies", each_item=True)
+    def _validate_dependency(cls, value: str) -> str:
+        parse_requirement(value)
+        return value
+
+    @property
+    def parsed_version(self) -> Optional[Version]:
+        # Versions outside the supported format are treated like missing versions
+        if self.version is None:
+            return None
+        try:
+            return parse_version(self.version)
+        except ValueError:
+            return None
+
+    @property
+    def requirements(self) -> List[Requirement]:
+        return [parse_requirement(dependency) for dependency in self.dependencies]
 
 
 class Manifest(BaseModel):
@@ -0,0 +1,138 @@
+import operator
+import re
+from functools import lru_cache
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+_REQUIREMENT_RE = re.compile(r"^\s*([^\s<>=!~,]+)\s*(.*?)\s*$")
+_CONSTRAINT_RE = re.compile(r"^\s*(==|!=|>=|<=|>|<)\s*([^\s,]+)\s*$")
+_VERSION_RE = re.compile(
+    r"^v?(\d+(?:\.\d+)*)"
+    r"(?:[-_.]?(dev|a|alpha|b|beta|c|rc|pre|preview|post)[-_.]?(\d+)?)?"
+    r"(?:\+[0-9a-z.-]*)?$",
+    re.IGNORECASE,
+)
+
+# Pre-releases sort before the final release and post-releases after it
+_PHASES = {
+    "dev": -4,
+    "a": -3,
+    "alpha": -3,
+    "b": -2,
+    "beta": -2,
+    "c": -1,
+    "rc": -1,
+    "pre": -1,
+    "preview": -1,
+    "post": 1,
+}
+_PHASE_NAMES = {-4: ".dev", -3: "a", -2: "b", -1: "rc", 1: ".post"}
+
+
+class Version(NamedTuple):
+    """
+    A parsed plugin version, ordered by release numbers and then by release phase
+    """
+
+    release: Tuple[int, ...]
+    phase: int = 0
+    number: int = 0
+
+    def __str__(self) -> str:
+        version = ".".join(str(i) for i in self.release) or "0"
+        if self.phase:
+            version += _PHASE_NAMES[self.phase] + str(self.number)
+        return version
+
+
+_OPERATORS: Dict[str, Callable[[Version, Version], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+
+
+@lru_cache(maxsize=None)
+def parse_version(version: str) -> Version:
+    """
+    Parses a version string such as ``1.2``, ``1.2.0rc1`` or ``1.2-beta``
+
+    Trailing zeros are dropped so that ``1.2`` and ``1.2.0`` compare equal, and build
+    metadata such as ``+build.1`` is ignored.
+
+    :param version: The version string to parse
+    :return: The parsed version
+    :raises ValueError: If the version is malformed
+    """
+    match = _VERSION_RE.match(version.strip())
+    if match is None:
+        raise ValueError("Invalid version {!r}.".format(version))
+    release, phase, number = match.groups()
+
+    parts = [int(i) for i in release.split(".")]
+    while parts and parts[-1] == 0:
+        parts.pop()
+    if phase is None:
+        return Version(tuple(parts))
+    return Version(tuple(parts), _PHASES[phase.lower()], int(number or 0))
+
+
+class Requirement(NamedTuple):
+    """
+    A dependency on a plugin, optionally restricted to a range of versions
+    """
+
+    id: str
+    constraints: Tuple[Tuple[str, Version], ...] = ()
+
+    def matches(self, version: Optional[Version]) -> bool:
+        """
+        Checks whether a plugin version satisfies this requirement
+
+        :param version: The parsed plugin version, or None if the plugin is unversioned
+        :return: Whether the version satisfies all constraints
+        """
+        if not self.constraints:
+            return True
+        if version is None:
+            return False
+        return all(_OPERATORS[op](version, target) for op, target in self.constraints)
+
+    def __str__(self) -> str:
+        return self.id + ",".join(op + str(target) for op, target in self.constraints)
+
+
+@lru_cache(maxsize=None)
+def parse_requirement(requirement: str) -> Requirement:
+    """
+    Parses a dependency specifier such as ``tests.basic>=1.2,<2``
+
+    :param requirement: The dependency specifier to parse
+    :return: The parsed requirement
+    :raises ValueError: If the specifier is malformed
+    """
+    match = _REQUIREMENT_RE.match(requirement)
+    if match is None:
+        raise ValueError("Invalid dependency specifier {!r}.".format(requirement))
+    plugin_id, specifiers = match.groups()
+
+    constraints = []
+    if specifiers:
+        for specifier in specifiers.split(","):
+            constraint = _CONSTRAINT_RE.match(specifier)
+            version = None
+            if constraint is not None:
+                try:
+                    version = parse_version(constraint.group(2))
+                except ValueError:
+                    pass
+            if constraint is None or version is None:
+                raise ValueError(
+                    "Invalid version constraint {!r} in {!r}.".format(
+                        specifier, requirement
+                    )
+                )
+            constraints.append((constraint.group(1), version))
+    return Requirement(plugin_id, tuple(constraints))
@@ -0,0 +1,93 @@
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Callable, FrozenSet, Iterator, Optional
+
+from .types import Manifest
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .plugin_loader import PluginLoader
+
+
+class PluginRecord:
+    """
+    A loaded plugin together with its manifest and module
+
+    Records are created once when a plugin loads and reused by every view, so
+    enumerating plugins does not allocate per plugin.
+    """
+
+    __slots__ = ("id", "manifest", "plugin", "module", "dependencies")
+
+    id: str
+    manifest: Manifest
+    plugin: Any
+    module: ModuleType
+    dependencies: FrozenSet[str]
+
+    def __init__(self, manifest: Manifest, plugin: Any, module: ModuleType):
+        """
+        Initializes the record
+
+        :param manifest: The manifest the plugin was loaded from
+        :param plugin: The plugin instance
+        :param module: The plugin module
+        """
+        setattr_ = object.__setattr__
+        setattr_(self, "id", manifest.jigsaw.id)
+        setattr_(self, "manifest", manifest)
+        setattr_(self, "plugin", plugin)
+        setattr_(self, "module", module)
+        setattr_(
+            self,
+            "dependencies",
+            frozenset(i.id for i in manifest.jigsaw.requirements),
+        )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("PluginRecord is read-only")
+
+    def __repr__(self) -> str:
+        return "PluginRecord({!r})".format(self.id)
+
+
+class PluginView:
+    """
+    A live, read-only view of the loaded plugins, optionally filtered
+
+    Like dictionary views, a view reflects later loads and unloads, and the loader
+    must not be modified while iterating over it.
+    """
+
+    __slots__ = ("_loader", "_predicate")
+
+    def __init__(
+        self,
+        loader: "PluginLoader",
+        predicate: Optional[Callable[[PluginRecord], bool]] = None,
+    ):
+        """
+        Initializes the view
+
+        :param loader: The plugin loader to view
+        :param predicate: Only records for which this returns True are included
+        """
+        self._loader = loader
+        self._predicate = predicate
+
+    def __iter__(self) -> Iterator[PluginRecord]:
+        records = self._loader._records.values()
+        if self._predicate is None:
+            return iter(records)
+        return filter(self._predicate, records)
+
+    def __len__(self) -> int:
+        if self._predicate is None:
+            return len(self._loader._records)
+        return sum(1 for _ in self)
+
+    def __contains__(self, plugin_id: object) -> bool:
+        if not isinstance(plugin_id, str):
+            return False
+        record = self._loader._records.get(plugin_id)
+        return record is not None and (
+            self._predicate is None or self._predicate(record)
+        )
@@ -0,0 +1,5 @@
+from jigsaw import JigsawPlugin
+
+
+class Plugin(JigsawPlugin):
+    pass
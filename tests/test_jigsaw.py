@@ -1,11 +1,29 @@
+import importlib
+import importlib.util
+import json
+import py_compile
 import sys
 import os
+import threading
+import time
+import tracemalloc
+import types
 import pytest
 
 sys.path.append(os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "..")))
 print(sys.path)
 
 import jigsaw
+from jigsaw.__main__ import main
+from jigsaw.context import LoaderContext
+from jigsaw.critical_path import analyze
+from jigsaw.listeners import LoaderListener
+from jigsaw.profiler import StartupProfiler
+from jigsaw.prefetch import SourcePrefetcher, load_order, plugin_files
+from jigsaw.resolver import ResolutionError, Resolver
+from jigsaw.sandbox import ImportGuard, ImportPolicyViolation
+from jigsaw.transaction import TransactionError
+from jigsaw.versions import Requirement, Version, parse_requirement, parse_version
 
 
 def test_initializing_jigsaw_with_no_plugin_path_specified():
@@ -202,3 +220,823 @@ def test_quickload():
     j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),))
     j.quickload()
     assert j.get_plugin_loaded("tests.basic")
+
+
+def test_resolving_version_constraints():
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),))
+    j.load_manifests()
+    resolved = j.resolve_manifests()
+    assert resolved["tests.versioned"].jigsaw.version == "1.4.0"
+    assert "tests.missing_dependency" not in resolved
+
+
+def test_loading_plugins_with_version_constraints():
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),))
+    j.load_manifests()
+    j.load_plugins()
+    assert j.get_plugin_loaded("tests.version_constraint")
+    assert j.get_plugin("tests.versioned").manifest.jigsaw.version == "1.4.0"
+
+
+def test_loading_specific_plugin_with_version_constraints():
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),))
+    j.load_manifests()
+    j.load_plugin(j.get_manifest("tests.version_constraint"))
+    assert j.get_plugin("tests.versioned").manifest.jigsaw.version == "1.4.0"
+
+
+def test_reloading_and_unloading_duplicate_version_plugin():
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),))
+    j.load_manifests()
+    j.load_plugins()
+    assert j.get_plugin("tests.versioned").manifest.jigsaw.version == "1.4.0"
+
+    j.reload_plugin("tests.versioned")
+    assert j.get_plugin("tests.versioned").manifest.jigsaw.version == "1.4.0"
+
+    j.unload_plugin("tests.version_constraint")
+    j.unload_plugin("tests.versioned")
+    assert not j.get_plugin_loaded("tests.versioned")
+    assert j.get_manifest("tests.versioned").jigsaw.version == "2.0.0"
+
+
+def _manifest(id, version=None, dependencies=()):
+    return jigsaw.Manifest.parse_obj(
+        {"jigsaw": {"id": id, "name": id, "version": version, "dependencies": list(dependencies)}}
+    )
+
+
+_PLUGIN_SOURCE = "from jigsaw import JigsawPlugin\n\n\nclass Plugin(JigsawPlugin):\n    pass\n"
+_TRACKED_PLUGIN_SOURCE = (
+    "from jigsaw import JigsawPlugin\n\nEVENTS = []\n\n\nclass Plugin(JigsawPlugin):\n"
+    "    def enable(self):\n        EVENTS.append('enable')\n\n"
+    "    def disable(self):\n        EVENTS.append('disable')\n"
+)
+
+
+def _write_plugin(plugins_dir, name, manifest, source=_PLUGIN_SOURCE):
+    plugin_dir = plugins_dir / name
+    plugin_dir.mkdir(parents=True, exist_ok=True)
+    (plugin_dir / "plugin.toml").write_text(manifest)
+    (plugin_dir / "__init__.py").write_text(source)
+    return plugin_dir
+
+
+def test_parsing_versions():
+    assert parse_version("1.2") == parse_version("1.2.0") == Version((1, 2))
+    assert parse_version("2.0.0rc1") > parse_version("1.10")
+    assert parse_requirement("tests.basic>=1.2, <2") == Requirement("tests.basic", ((">=", Version((1, 2))), ("<", Version((2,)))))
+    with pytest.raises(ValueError):
+        parse_requirement("tests.basic~1.2")
+
+
+def test_parsing_pre_release_versions():
+    assert parse_version("1.0.dev1") < parse_version("1.0a1") < parse_version("1.0-beta") < parse_version("1.0rc1")
+    assert parse_version("1.0rc1") < parse_version("1.0") < parse_version("1.0.post1") < parse_version("1.0.1")
+    assert not parse_requirement("x==1.0").matches(parse_version("1.0rc1"))
+    assert parse_requirement("x<1.0").matches(parse_version("1.0rc1"))
+    assert str(parse_requirement("x>=1.0-rc.2")) == "x>=1rc2"
+    with pytest.raises(ValueError):
+        parse_version("dev")
+    with pytest.raises(ValueError):
+        parse_requirement("x>=1.x")
+    assert parse_version("1.0.0+build.1") == parse_version("1.0")
+    assert parse_version("1.0.0-rc.1+abc") == parse_version("1.0rc1")
+    assert _manifest("x", "1.0.0-SNAPSHOT").jigsaw.parsed_version is None
+    assert not parse_requirement("x>=1").matches(_manifest("x", "dev").jigsaw.parsed_version)
+
+
+def test_loading_plugin_with_unrecognized_version(tmp_path):
+    _write_plugin(tmp_path, "Snapshot", '[jigsaw]\nid = "tests.snapshot"\nname = "Snapshot"\nversion = "1.0.0-SNAPSHOT"\n')
+    j = jigsaw.PluginLoader((str(tmp_path),))
+    j.quickload()
+    assert j.get_plugin_loaded("tests.snapshot")
+    assert j.get_manifest("tests.snapshot").jigsaw.parsed_version is None
+
+
+def test_invalid_dependency_specifier():
+    with pytest.raises(ValueError):
+        _manifest("a", dependencies=["b=>1"])
+
+
+def test_resolver_backtracks():
+    resolver = Resolver([
+        _manifest("app", "1", ["lib>=1", "util"]),
+        _manifest("lib", "2", ["util>=2"]),
+        _manifest("lib", "1", ["util<2"]),
+        _manifest("util", "1"),
+    ])
+    resolved = resolver.resolve([Requirement("app")])
+    assert resolved["lib"].jigsaw.version == "1"
+    assert resolved["util"].jigsaw.version == "1"
+
+
+def test_resolver_conflict():
+    resolver = Resolver([
+        _manifest("a", "1", ["c<2"]),
+        _manifest("b", "1", ["c>=2"]),
+        _manifest("c", "1"),
+        _manifest("c", "2"),
+    ])
+    with pytest.raises(ResolutionError):
+        resolver.resolve([Requirement("a"), Requirement("b")])
+    resolved, failures = resolver.resolve_all()
+    assert set(resolved) == {"a", "c"}
+    assert set(failures) == {"b"}
+
+
+def test_resolver_large_catalog():
+    manifests = []
+    for i in range(2000):
+        for version in range(3):
+            dependencies = ["p{}>={}".format(i + 1, version)] if i < 1999 else []
+            manifests.append(_manifest("p{}".format(i), str(version), dependencies))
+    resolved = Resolver(manifests).resolve([Requirement("p0")])
+    assert len(resolved) == 2000
+    assert resolved["p0"].jigsaw.version == "2"
+
+
+def test_resolver_backjumps_over_unrelated_choices():
+    # Without backjumping, the conflict under k retries all 2^40 choices for x0..x39
+    manifests = [
+        _manifest("app", "1", ["x{}".format(i) for i in range(40)] + ["k"]),
+        _manifest("k", "2", ["mm", "n<2"]),
+        _manifest("k", "1"),
+        _manifest("mm", "1", ["n>=2"]),
+        _manifest("n", "1"),
+        _manifest("n", "2"),
+    ]
+    for i in range(40):
+        manifests += [_manifest("x{}".format(i), "1"), _manifest("x{}".format(i), "2")]
+    resolved = Resolver(manifests).resolve([Requirement("app")])
+    assert resolved["k"].jigsaw.version == "1"
+    assert resolved["x0"].jigsaw.version == "2"
+
+    with pytest.raises(ResolutionError):
+        Resolver(manifests).resolve([Requirement("app"), parse_requirement("k>=2")])
+
+
+def test_resolve_all_large_catalog_with_conflicts():
+    manifests = [_manifest("p{}".format(i), "1") for i in range(2000)]
+    manifests += [
+        _manifest("a", "1", ["c<2"]),
+        _manifest("b", "1", ["c>=2"]),
+        _manifest("c", "1"),
+        _manifest("c", "2"),
+    ]
+    resolved, failures = Resolver(manifests).resolve_all()
+    assert list(failures) == ["b"]
+    assert len(resolved) == 2002
+
+    chain = [_manifest("q{}".format(i), "1", ["q{}".format(i + 1)]) for i in range(2000)]
+    resolved, failures = Resolver(chain).resolve_all()
+    assert resolved == {}
+    assert len(failures) == 2000
+
+
+def test_profiling_startup(tmp_path):
+    _write_plugin(tmp_path / "plugins", "ImportTest", '[jigsaw]\nid = "tests.import"\nname = "Import Test"\n', source="import jigsaw_profiled_module\n" + _PLUGIN_SOURCE)
+    (tmp_path / "jigsaw_profiled_module.py").write_text("VALUE = [0] * 1000\n")
+    sys.path.insert(0, str(tmp_path))
+    try:
+        j = jigsaw.PluginLoader((str(tmp_path / "plugins"), os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins"))))
+        profile = StartupProfiler(j).run()
+    finally:
+        sys.path.remove(str(tmp_path))
+    assert j.get_plugin_loaded("tests.import")
+    assert "tests.error" not in profile.plugins
+    assert [i.module for i in profile.import_hotspots() if i.plugin_id == "tests.import"] == ["jigsaw_profiled_module"]
+    for dependency, dependent in zip(profile.critical_path, profile.critical_path[1:]):
+        assert dependency in [i.id for i in j.get_manifest(dependent).jigsaw.requirements]
+    assert "Critical path" in profile.format_report()
+
+
+def test_profiler_cli(tmp_path, capsys):
+    trace = tmp_path / "trace.json"
+    assert main([os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")), "--trace", str(trace)]) == 0
+    assert "Slowest plugins:" in capsys.readouterr().out
+    with open(trace) as f:
+        events = json.load(f)["traceEvents"]
+    assert {"discovery", "resolution", "load", "enable"} <= {i["name"] for i in events if i["cat"] == "phase"}
+
+
+def test_profiler_cli_missing_path(tmp_path, capsys):
+    with pytest.raises(SystemExit) as e:
+        main([str(tmp_path / "missing")])
+    assert e.value.code == 2
+    assert "is not a directory" in capsys.readouterr().err
+
+
+def test_loader_listener():
+    events = []
+
+    class RecordingListener(LoaderListener):
+        def manifests_resolved(self, resolved):
+            events.append(("resolved", len(resolved)))
+
+        def load_started(self, manifest):
+            events.append(("load_started", manifest.jigsaw.id))
+
+        def load_finished(self, manifest):
+            events.append(("load_finished", manifest.jigsaw.id))
+
+        def enable_started(self, plugin_id):
+            events.append(("enable_started", plugin_id))
+
+        def enable_finished(self, plugin_id):
+            events.append(("enable_finished", plugin_id))
+
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),))
+    listener = RecordingListener()
+    j.add_listener(listener)
+    j.load_manifests()
+    j.load_plugin(j.get_manifest("tests.dependency"))
+    j.enable_plugin("tests.basic")
+    assert events == [
+        ("load_started", "tests.dependency"),
+        ("load_started", "tests.basic"),
+        ("load_finished", "tests.basic"),
+        ("load_finished", "tests.dependency"),
+        ("enable_started", "tests.basic"),
+        ("enable_finished", "tests.basic"),
+    ]
+
+    j.remove_listener(listener)
+    j.resolve_manifests()
+    assert len(events) == 6
+
+
+def test_profiling_uses_loader_prefetch(tmp_path, monkeypatch):
+    advanced = []
+
+    class RecordingPrefetcher(SourcePrefetcher):
+        def advance(self, plugin_id):
+            advanced.append(plugin_id)
+            super().advance(plugin_id)
+
+    monkeypatch.setattr(jigsaw.plugin_loader, "SourcePrefetcher", RecordingPrefetcher)
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),), prefetch_window=2)
+    profile = StartupProfiler(j).run()
+    assert [i for i in advanced if i in profile.plugins] == list(profile.plugins)
+    assert list(profile.plugins) == [i.id for i in j.view_plugins()]
+
+
+def test_critical_path_analysis():
+    analysis = analyze(
+        {"a": 1.0, "b": 2.0, "c": 4.0, "d": 1.0},
+        {"b": ["a"], "c": ["a"], "d": ["b", "c"]},
+    )
+    assert analysis.path == ["a", "c", "d"]
+    assert analysis.parallel_time == 6.0
+    assert analysis.serial_time == 8.0
+    assert analysis.slack == {"a": 0.0, "b": 2.0, "c": 0.0, "d": 0.0}
+    assert analysis.edge_savings == [("a", "c", 1.0), ("c", "d", 1.0)]
+
+
+def test_critical_path_analysis_cycle():
+    with pytest.raises(ValueError):
+        analyze({"a": 1.0, "b": 1.0}, {"a": ["b"], "b": ["a"]})
+
+
+def test_loader_critical_path():
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),))
+    j.load_manifests()
+    j.load_plugin(j.get_manifest("tests.dependency"))
+    j.enable_all_plugins()
+    assert j.get_load_cost("tests.basic") > 0
+    assert j.get_enable_cost("tests.dependency") is not None
+    analysis = j.analyze_critical_path()
+    assert analysis.path == ["tests.basic", "tests.dependency"]
+    assert "Critical path:" in analysis.format_report()
+
+
+def _write_policy_plugin(tmp_path, name, policy, source):
+    manifest = '[jigsaw]\nid = "tests.{0}"\nname = "{0}"\n\n[jigsaw.imports]\n{1}\n'.format(name, policy)
+    return str(_write_plugin(tmp_path / "plugins", name, manifest, source=source + "\n" + _PLUGIN_SOURCE))
+
+
+def _load_policy_plugin(tmp_path, name, policy, source):
+    plugin_dir = _write_policy_plugin(tmp_path, name, policy, source)
+    j = jigsaw.PluginLoader((str(tmp_path / "plugins"),))
+    j.load_manifest(plugin_dir)
+    j.load_plugin(j.get_manifest("tests." + name))
+    return j, plugin_dir
+
+
+def test_import_policy_denied(tmp_path):
+    (tmp_path / "jigsaw_denied_module.py").write_text("VALUE = 1\n")
+    sys.path.insert(0, str(tmp_path))
+    try:
+        j, plugin_dir = _load_policy_plugin(tmp_path, "denied", 'denied = ["jigsaw_denied_module"]', "import jigsaw_denied_module")
+    finally:
+        sys.path.remove(str(tmp_path))
+    assert not j.get_plugin_loaded("tests.denied")
+    assert "ImportPolicyViolation" in open(os.path.join(plugin_dir, "error.log")).read()
+    assert "jigsaw_denied_module" not in sys.modules
+    assert not any(isinstance(i, ImportGuard) for i in sys.meta_path)
+
+
+def test_import_policy_ignores_other_threads(tmp_path):
+    (tmp_path / "jigsaw_thread_module.py").write_text("VALUE = 1\n")
+    (tmp_path / "jigsaw_guarded_module.py").write_text("VALUE = 1\n")
+    manifest = jigsaw.Manifest.parse_obj(
+        {"jigsaw": {"id": "tests.thread", "name": "Thread", "imports": {"denied": ["jigsaw_thread_module", "jigsaw_guarded_module"]}}}
+    )
+    guard = ImportGuard()
+    errors = []
+
+    def import_from_thread():
+        try:
+            importlib.import_module("jigsaw_thread_module")
+        except ImportError as e:
+            errors.append(e)
+
+    sys.path.insert(0, str(tmp_path))
+    try:
+        with guard.enforce(manifest):
+            thread = threading.Thread(target=import_from_thread)
+            thread.start()
+            thread.join()
+            with pytest.raises(ImportPolicyViolation):
+                importlib.import_module("jigsaw_guarded_module")
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("jigsaw_thread_module", None)
+    assert errors == []
+    assert guard not in sys.meta_path
+
+
+def test_import_policy_allowed(tmp_path):
+    (tmp_path / "jigsaw_allowed_module.py").write_text("import jigsaw_transitive_module\n")
+    (tmp_path / "jigsaw_transitive_module.py").write_text("VALUE = 1\n")
+    (tmp_path / "jigsaw_unlisted_module.py").write_text("VALUE = 1\n")
+    (tmp_path / "plugins" / "allowed").mkdir(parents=True)
+    (tmp_path / "plugins" / "allowed" / "helper.py").write_text("VALUE = 1\n")
+    sys.path.insert(0, str(tmp_path))
+    try:
+        j, _ = _load_policy_plugin(
+            tmp_path,
+            "allowed",
+            'allowed = ["jigsaw_allowed_module"]',
+            "import os\nimport sys\nsys.path.insert(0, os.path.dirname(__file__))\n"
+            "import jigsaw_allowed_module\nimport helper\nsys.path.pop(0)\n",
+        )
+        assert j.get_plugin_loaded("tests.allowed")
+        assert "jigsaw_transitive_module" in sys.modules
+
+        j, plugin_dir = _load_policy_plugin(tmp_path / "unlisted", "unlisted", 'allowed = ["jigsaw_allowed_module"]', "import jigsaw_unlisted_module")
+    finally:
+        sys.path.remove(str(tmp_path))
+    assert not j.get_plugin_loaded("tests.unlisted")
+    assert "not in its allowed imports" in open(os.path.join(plugin_dir, "error.log")).read()
+
+
+def test_import_policy_applies_to_plugin_modules(tmp_path):
+    (tmp_path / "jigsaw_forbidden_module.py").write_text("VALUE = 1\n")
+    plugin_dir = _write_policy_plugin(
+        tmp_path,
+        "local",
+        'allowed = ["os", "sys"]',
+        "import os\nimport sys\nsys.path.insert(0, os.path.dirname(__file__))\n"
+        "try:\n    import jigsaw_local_helper\nfinally:\n    sys.path.pop(0)\n",
+    )
+    with open(os.path.join(plugin_dir, "jigsaw_local_helper.py"), "w") as f:
+        f.write("import jigsaw_forbidden_module\n")
+    sys.path.insert(0, str(tmp_path))
+    try:
+        j = jigsaw.PluginLoader((str(tmp_path / "plugins"),))
+        j.load_manifest(plugin_dir)
+        j.load_plugin(j.get_manifest("tests.local"))
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.modules.pop("jigsaw_local_helper", None)
+    assert not j.get_plugin_loaded("tests.local")
+    assert "jigsaw_forbidden_module" not in sys.modules
+    assert "not in its allowed imports" in open(os.path.join(plugin_dir, "error.log")).read()
+
+
+def test_import_policy_max_memory(tmp_path):
+    (tmp_path / "jigsaw_large_module.py").write_text("VALUE = [bytearray(1000) for i in range(1000)]\n")
+    sys.path.insert(0, str(tmp_path))
+    try:
+        j, plugin_dir = _load_policy_plugin(tmp_path, "memory", "max_memory = 100000", "import jigsaw_large_module")
+    finally:
+        sys.path.remove(str(tmp_path))
+    assert not j.get_plugin_loaded("tests.memory")
+    assert "import memory limit" in open(os.path.join(plugin_dir, "error.log")).read()
+    assert not tracemalloc.is_tracing()
+
+
+def test_import_policy_max_memory_ignores_other_threads(tmp_path):
+    sync = types.ModuleType("jigsaw_memory_sync")
+    sync.importing = threading.Event()
+    sync.allocated = threading.Event()
+    sys.modules["jigsaw_memory_sync"] = sync
+    (tmp_path / "jigsaw_small_module.py").write_text(
+        "import jigsaw_memory_sync\njigsaw_memory_sync.importing.set()\njigsaw_memory_sync.allocated.wait(5)\n"
+    )
+    retained = []
+
+    def allocate():
+        sync.importing.wait(5)
+        retained.append([bytearray(1000) for i in range(1000)])
+        sync.allocated.set()
+
+    thread = threading.Thread(target=allocate)
+    thread.start()
+    sys.path.insert(0, str(tmp_path))
+    try:
+        j, _ = _load_policy_plugin(tmp_path, "threaded", "max_memory = 100000", "import jigsaw_small_module")
+    finally:
+        sys.path.remove(str(tmp_path))
+        thread.join()
+        del sys.modules["jigsaw_memory_sync"]
+    assert retained
+    assert j.get_plugin_loaded("tests.threaded")
+
+
+def test_import_policy_decisions_are_memoized():
+    lookups = []
+
+    class RecordingFinder:
+        def find_spec(self, fullname, path, target=None):
+            if fullname == "jigsaw_never_imported":
+                lookups.append(fullname)
+            return None
+
+    guard = ImportGuard()
+    manifest = _manifest("tests.memo")
+    manifest.jigsaw.imports.allowed = []
+    finder = RecordingFinder()
+    sys.meta_path.append(finder)
+    try:
+        with guard.enforce(manifest):
+            for i in range(2):
+                with pytest.raises(ImportPolicyViolation):
+                    import jigsaw_never_imported
+        assert len(lookups) == 1
+
+        guard.forget("tests.memo")
+        with guard.enforce(manifest):
+            with pytest.raises(ImportPolicyViolation):
+                import jigsaw_never_imported
+        assert len(lookups) == 2
+    finally:
+        sys.meta_path.remove(finder)
+
+
+def test_rescan_manifests(tmp_path):
+    _write_plugin(tmp_path, "Kept", '[jigsaw]\nid = "tests.kept"\nname = "Kept"\n')
+    _write_plugin(tmp_path, "Changed", '[jigsaw]\nid = "tests.changed"\nname = "Changed"\nversion = "1.0"\n')
+    removed_dir = _write_plugin(tmp_path, "Removed", '[jigsaw]\nid = "tests.removed"\nname = "Removed"\n')
+    j = jigsaw.PluginLoader((str(tmp_path),))
+    j.quickload()
+    kept = j.get_manifest("tests.kept")
+
+    changes = j.rescan_manifests()
+    assert not changes
+    assert len(changes.unchanged) == 3
+
+    _write_plugin(tmp_path, "Changed", '[jigsaw]\nid = "tests.changed"\nname = "Changed"\nversion = "1.1"\n')
+    _write_plugin(tmp_path, "Added", '[jigsaw]\nid = "tests.added"\nname = "Added"\n')
+    os.remove(removed_dir / "plugin.toml")
+    changes = j.reload_all_manifests()
+    assert [i.jigsaw.id for i in changes.added] == ["tests.added"]
+    assert [i.jigsaw.id for i in changes.removed] == ["tests.removed"]
+    assert [(i.jigsaw.version, k.jigsaw.version) for i, k in changes.changed] == [("1.0", "1.1")]
+    assert changes.unchanged == [kept]
+    assert j.get_manifest("tests.kept") is kept
+    assert j.get_manifest("tests.removed") is None
+
+    j.apply_manifest_changes(changes)
+    assert j.get_plugin_loaded("tests.added")
+    assert not j.get_plugin_loaded("tests.removed")
+    assert j.get_plugin("tests.changed").manifest.jigsaw.version == "1.1"
+    assert not j.rescan_manifests()
+
+
+def test_transaction_commit(tmp_path):
+    _write_plugin(tmp_path, "Base", '[jigsaw]\nid = "tests.base"\nname = "Base"\n', source=_TRACKED_PLUGIN_SOURCE)
+    _write_plugin(tmp_path, "Child", '[jigsaw]\nid = "tests.child"\nname = "Child"\ndependencies = ["tests.base"]\n', source=_TRACKED_PLUGIN_SOURCE)
+    _write_plugin(tmp_path, "Other", '[jigsaw]\nid = "tests.other"\nname = "Other"\n', source=_TRACKED_PLUGIN_SOURCE)
+    j = jigsaw.PluginLoader((str(tmp_path),))
+    j.load_manifests()
+    j.load_plugin(j.get_manifest("tests.other"))
+    j.enable_all_plugins()
+    other_module = j.get_module("tests.other")
+
+    with j.transaction() as transaction:
+        transaction.load(j.get_manifest("tests.child"))
+        transaction.reload("tests.other")
+        assert transaction.validate() == [["tests.base", "tests.other"], ["tests.child"]]
+    assert j.get_plugin_loaded("tests.base")
+    assert j.get_plugin_loaded("tests.child")
+    assert j.get_module("tests.child").EVENTS == ["enable"]
+    assert other_module.EVENTS == ["enable", "disable"]
+    assert j.get_module("tests.other") is not other_module
+
+    transaction = j.transaction()
+    transaction.unload("tests.base")
+    with pytest.raises(TransactionError):
+        transaction.validate()
+
+    transaction = j.transaction()
+    transaction.unload("tests.child")
+    transaction.unload("tests.base")
+    transaction.commit()
+    assert not j.get_plugin_loaded("tests.base")
+    assert j.get_manifest("tests.base") is None
+
+
+def test_transaction_rollback(tmp_path):
+    _write_plugin(tmp_path, "Base", '[jigsaw]\nid = "tests.base"\nname = "Base"\n', source=_TRACKED_PLUGIN_SOURCE)
+    _write_plugin(tmp_path, "Child", '[jigsaw]\nid = "tests.child"\nname = "Child"\ndependencies = ["tests.base"]\n', source=_TRACKED_PLUGIN_SOURCE)
+    j = jigsaw.PluginLoader((str(tmp_path),))
+    j.quickload()
+    base, child = j.get_plugin("tests.base"), j.get_plugin("tests.child")
+    base_module = j.get_module("tests.base")
+    manifests = j.get_all_plugins()
+
+    _write_plugin(tmp_path, "Child", '[jigsaw]\nid = "tests.child"\nname = "Child"\ndependencies = ["tests.base"]\n', source="raise RuntimeError('broken')\n" + _TRACKED_PLUGIN_SOURCE)
+    with pytest.raises(TransactionError):
+        j.reload_all_plugins()
+    assert j.get_plugin("tests.base") is base
+    assert j.get_plugin("tests.child") is child
+    assert j.get_module("tests.base") is base_module
+    assert base_module.EVENTS == ["enable"]
+    assert j.get_all_plugins() == manifests
+
+
+def _wait_for(condition):
+    deadline = time.time() + 5
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_load_order_prediction():
+    a, b, c = _manifest("a", dependencies=["b"]), _manifest("b", dependencies=["c"]), _manifest("c")
+    order = load_order([a, c], {"a": a, "b": b, "c": c})
+    assert [i.jigsaw.id for i in order] == ["c", "b", "a"]
+
+
+def test_plugin_files(tmp_path):
+    plugin_dir = _write_plugin(tmp_path, "Files", '[jigsaw]\nid = "tests.files"\nname = "Files"\n')
+    (plugin_dir / "helper.py").write_text("VALUE = 1\n")
+    py_compile.compile(str(plugin_dir / "helper.py"))
+    manifest = _manifest("tests.files")
+    manifest.jigsaw.path = str(plugin_dir)
+    files = plugin_files(manifest)
+    assert files[0] == str(plugin_dir / "__init__.py")
+    assert files[1:] == [str(plugin_dir / "helper.py"), importlib.util.cache_from_source(str(plugin_dir / "helper.py"))]
+
+
+def test_prefetch_window():
+    manifests = [_manifest("a"), _manifest("b"), _manifest("c")]
+    for manifest in manifests:
+        manifest.jigsaw.path = os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins", "BasicTest"))
+    prefetcher = SourcePrefetcher(manifests, 1)
+    prefetcher.start()
+    try:
+        assert _wait_for(lambda: prefetcher.warmed == ["a"])
+        time.sleep(0.05)
+        assert prefetcher.warmed == ["a"]
+        prefetcher.advance("a")
+        assert _wait_for(lambda: prefetcher.warmed == ["a", "b"])
+    finally:
+        prefetcher.stop()
+    assert prefetcher.warmed == ["a", "b"]
+
+
+def test_loading_plugins_with_prefetch():
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),), prefetch_window=2)
+    j.load_manifests()
+    j.load_plugins()
+    assert j.get_plugin_loaded("tests.dependency")
+    assert "jigsaw-prefetch" not in [i.name for i in threading.enumerate()]
+
+
+def test_prefetching_dependency_chain(tmp_path, monkeypatch):
+    advanced = []
+
+    class RecordingPrefetcher(SourcePrefetcher):
+        def advance(self, plugin_id):
+            advanced.append(plugin_id)
+            super().advance(plugin_id)
+
+    monkeypatch.setattr(jigsaw.plugin_loader, "SourcePrefetcher", RecordingPrefetcher)
+    for name, dependency in [("a", "b"), ("b", "c"), ("c", "d"), ("d", None)]:
+        dependencies = 'dependencies = ["tests.{}"]\n'.format(dependency) if dependency else ""
+        _write_plugin(tmp_path, name, '[jigsaw]\nid = "tests.{0}"\nname = "{0}"\n{1}'.format(name, dependencies))
+    j = jigsaw.PluginLoader((str(tmp_path),), prefetch_window=1)
+    j.load_manifests()
+    j.load_plugins()
+    assert j.get_plugin_loaded("tests.a")
+    # Plugins advance in the predicted load order, so none is skipped as overtaken
+    assert advanced == ["tests.d", "tests.c", "tests.b", "tests.a"]
+
+
+def test_plugin_views():
+    j = jigsaw.PluginLoader((os.path.abspath(os.path.join(os.path.abspath(__file__), "..", "plugins")),))
+    j.load_manifests()
+    plugins = j.view_plugins()
+    enabled = j.view_enabled_plugins()
+    dependents = j.view_dependents("tests.basic")
+    assert len(plugins) == 0
+
+    generation = j.generation
+    j.load_plugin(j.get_manifest("tests.dependency"))
+    assert j.generation != generation
+    assert [i.id for i in plugins] == ["tests.basic", "tests.dependency"]
+    assert [i.id for i in dependents] == ["tests.dependency"]
+    assert "tests.basic" in plugins and "tests.basic" not in enabled
+    record = next(iter(plugins))
+    assert record.plugin is j.get_plugin("tests.basic")
+    assert record.module is j.get_module("tests.basic")
+    assert record.manifest is j.get_manifest("tests.basic")
+    with pytest.raises(AttributeError):
+        record.plugin = None
+
+    generation = j.generation
+    j.enable_plugin("tests.basic")
+    assert j.generation != generation
+    assert j.get_plugin_enabled("tests.basic")
+    assert [i.id for i in enabled] == ["tests.basic"]
+    assert next(iter(plugins)) is record
+
+    j.disable_all_plugins()
+    assert len(enabled) == 0
+    j.unload_plugin("tests.dependency")
+    assert len(dependents) == 0
+    assert len(plugins) == 1
+
+
+def test_apply_manifest_changes_with_duplicate_ids(tmp_path):
+    _write_plugin(tmp_path, "A", '[jigsaw]\nid = "tests.x"\nname = "X"\nversion = "1.0"\n')
+    _write_plugin(tmp_path, "B", '[jigsaw]\nid = "tests.x"\nname = "X"\nversion = "2.0"\n')
+    j = jigsaw.PluginLoader((str(tmp_path),))
+    j.quickload()
+    plugin = j.get_plugin("tests.x")
+    assert plugin.manifest.jigsaw.version == "2.0"
+
+    _write_plugin(tmp_path, "A", '[jigsaw]\nid = "tests.x"\nname = "X"\nversion = "1.1"\n')
+    j.apply_manifest_changes(j.reload_all_manifests())
+    assert j.get_plugin("tests.x") is plugin
+
+    os.remove(tmp_path / "A" / "plugin.toml")
+    j.apply_manifest_changes(j.reload_all_manifests())
+    assert j.get_plugin("tests.x") is plugin
+    assert j.get_plugin_enabled("tests.x")
+
+    _write_plugin(tmp_path, "B", '[jigsaw]\nid = "tests.x"\nname = "X"\nversion = "2.1"\n')
+    j.apply_manifest_changes(j.reload_all_manifests())
+    assert j.get_plugin("tests.x") is not plugin
+    assert j.get_plugin("tests.x").manifest.jigsaw.version == "2.1"
+
+
+def test_apply_manifest_changes_rolls_back(tmp_path):
+    _write_plugin(tmp_path, "Base", '[jigsaw]\nid = "tests.base"\nname = "Base"\n', source=_TRACKED_PLUGIN_SOURCE)
+    child_dir = _write_plugin(tmp_path, "Child", '[jigsaw]\nid = "tests.child"\nname = "Child"\ndependencies = ["tests.base"]\n')
+    j = jigsaw.PluginLoader((str(tmp_path),))
+    j.quickload()
+    base = j.get_plugin("tests.base")
+
+    _write_plugin(tmp_path, "Base", '[jigsaw]\nid = "tests.base"\nname = "Base"\nmain_class = "Missing"\n')
+    _write_plugin(tmp_path, "Added", '[jigsaw]\nid = "tests.added"\nname = "Added"\n')
+    with pytest.raises(TransactionError):
+        j.apply_manifest_changes(j.reload_all_manifests())
+    assert j.get_plugin("tests.base") is base
+    assert j.get_plugin_enabled("tests.base")
+    assert j.get_module("tests.base").EVENTS == ["enable"]
+    assert j.get_plugin_enabled("tests.child")
+    assert j.get_plugin_enabled("tests.added")
+
+    os.remove(tmp_path / "Base" / "plugin.toml")
+    with pytest.raises(TransactionError):
+        j.apply_manifest_changes(j.reload_all_manifests())
+    assert j.get_plugin("tests.base") is base
+    assert j.get_plugin_enabled("tests.child")
+
+    os.remove(child_dir / "plugin.toml")
+    _write_plugin(tmp_path, "Base", '[jigsaw]\nid = "tests.base"\nname = "Base"\n', source=_TRACKED_PLUGIN_SOURCE)
+    j.apply_manifest_changes(j.reload_all_manifests())
+    assert not j.get_plugin_loaded("tests.child")
+    assert j.get_plugin("tests.base") is not base
+    assert j.get_plugin_enabled("tests.base")
+    assert not j.rescan_manifests()
+
+
+def test_apply_manifest_changes_loads_valid_new_plugins(tmp_path):
+    j = jigsaw.PluginLoader((str(tmp_path),))
+    j.quickload()
+    _write_plugin(tmp_path, "Good", '[jigsaw]\nid = "tests.good"\nname = "Good"\n')
+    _write_plugin(tmp_path, "Bad", '[jigsaw]\nid = "tests.bad"\nname = "Bad"\nmain_class = "Missing"\n')
+    j.apply_manifest_changes(j.rescan_manifests())
+    assert j.get_plugin_enabled("tests.good")
+    assert not j.get_plugin_loaded("tests.bad")
+
+
+def test_shared_loader_context(tmp_path):
+    plugin_dir = _write_plugin(tmp_path, "Shared", '[jigsaw]\nid = "tests.shared"\nname = "Shared"\n')
+    context = LoaderContext()
+    first = jigsaw.PluginLoader((str(tmp_path),), context=context)
+    second = jigsaw.PluginLoader((str(tmp_path),), context=context)
+    first.load_manifests()
+    second.load_manifests()
+    first.load_plugins()
+    second.load_plugins()
+
+    manifest = first.get_manifest("tests.shared")
+    assert second.get_manifest("tests.shared") is manifest
+    assert second.get_module("tests.shared") is first.get_module("tests.shared")
+    assert second.get_plugin("tests.shared") is not first.get_plugin("tests.shared")
+    key = context.module_key(manifest)
+    assert context.references(key) == 2
+
+    first.enable_plugin("tests.shared")
+    assert first.get_plugin_enabled("tests.shared")
+    assert not second.get_plugin_enabled("tests.shared")
+
+    # An explicit reload imports the module again, even while another loader uses it
+    module = first.get_module("tests.shared")
+    second.reload_all_plugins()
+    reloaded = second.get_module("tests.shared")
+    assert reloaded is not module
+    assert first.get_module("tests.shared") is module
+    assert context.get_module(key) is reloaded
+    assert context.references(key) == 2
+
+    first.unload_plugin("tests.shared")
+    assert context.references(key) == 1
+
+    # Sources are only fingerprinted again once the manifest changes
+    (plugin_dir / "helper.py").write_text("VALUE = 1\n")
+    third = jigsaw.PluginLoader((str(tmp_path),), context=context)
+    third.quickload()
+    assert third.get_module("tests.shared") is reloaded
+    assert context.references(key) == 2
+    third.unload_plugin("tests.shared")
+
+    (plugin_dir / "plugin.toml").write_text('[jigsaw]\nid = "tests.shared"\nname = "Shared"\nversion = "1.1"\n')
+    fourth = jigsaw.PluginLoader((str(tmp_path),), context=context)
+    fourth.quickload()
+    assert fourth.get_module("tests.shared") is not reloaded
+    assert context.module_key(fourth.get_manifest("tests.shared")) != key
+
+    second.unload_plugin("tests.shared")
+    assert context.references(key) == 0
+    assert context.get_module(key) is None
+
+
+def test_shared_loader_context_caches_module_keys(tmp_path, monkeypatch):
+    _write_plugin(tmp_path, "Shared", '[jigsaw]\nid = "tests.shared"\nname = "Shared"\n')
+    context = LoaderContext()
+    listed = []
+    plugin_sources = jigsaw.context.plugin_sources
+    monkeypatch.setattr(jigsaw.context, "plugin_sources", lambda manifest: listed.append(manifest) or plugin_sources(manifest))
+
+    for i in range(3):
+        j = jigsaw.PluginLoader((str(tmp_path),), context=context)
+        j.quickload()
+        j.reload_all_plugins()
+    assert len(listed) == 1
+
+
+def test_shared_loader_context_imports_once(tmp_path):
+    log = tmp_path / "imports.log"
+    source = "import time\n\nwith open({!r}, 'a') as f:\n    f.write('import\\n')\ntime.sleep(0.2)\n".format(str(log))
+    _write_plugin(tmp_path, "Shared", '[jigsaw]\nid = "tests.shared"\nname = "Shared"\n', source=source + _PLUGIN_SOURCE)
+    context = LoaderContext()
+    loaders = [jigsaw.PluginLoader((str(tmp_path),), context=context) for i in range(2)]
+    for loader in loaders:
+        loader.load_manifests()
+    threads = [threading.Thread(target=loader.load_plugins) for loader in loaders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert log.read_text() == "import\n"
+    assert loaders[0].get_module("tests.shared") is loaders[1].get_module("tests.shared")
+    assert context.references(context.module_key(loaders[0].get_manifest("tests.shared"))) == 2
+
+
+def test_shared_loader_context_rollback(tmp_path):
+    _write_plugin(tmp_path, "Shared", '[jigsaw]\nid = "tests.shared"\nname = "Shared"\n')
+    broken_dir = _write_plugin(tmp_path / "broken", "Broken", '[jigsaw]\nid = "tests.broken"\nname = "Broken"\ndependencies = ["tests.shared"]\n', source="raise RuntimeError()\n")
+    context = LoaderContext()
+    j = jigsaw.PluginLoader((str(tmp_path),), context=context)
+    j.load_manifests()
+    j.load_plugins()
+    j.load_manifest(str(broken_dir))
+    module = j.get_module("tests.shared")
+    key = context.module_key(j.get_manifest("tests.shared"))
+
+    transaction = j.transaction()
+    transaction.reload("tests.shared")
+    transaction.load(j.get_manifest("tests.broken"))
+    with pytest.raises(TransactionError):
+        transaction.commit()
+    assert j.get_module("tests.shared") is module
+    assert context.get_module(key) is module
+    assert context.references(key) == 1